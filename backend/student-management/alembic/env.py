@@ -8,16 +8,25 @@ import sys
 sys.path.append(os.getcwd())
 
 from models import Base
+from database import SYNC_SQLALCHEMY_DATABASE_URL
 
 config = context.config
+# Migrate the database the app is configured for (DATABASE_URL / SYNC_DATABASE_URL)
+config.set_main_option("sqlalchemy.url", SYNC_SQLALCHEMY_DATABASE_URL)
 fileConfig(config.config_file_name)
 target_metadata = Base.metadata
 
+def include_object(object, name, type_, reflected, compare_to):
+    # The FTS5 search table and its shadow tables are created by a migration, not the models;
+    # without this, autogenerate would propose dropping the search index
+    return not (type_ == "table" and name.startswith("students_fts"))
+
 def run_migrations_offline():
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -35,7 +44,8 @@ def run_migrations_online():
     with connectable.connect() as connection:
         context.configure(
             connection=connection, 
-            target_metadata=target_metadata
+            target_metadata=target_metadata,
+            include_object=include_object,
         )
 
         with context.begin_transaction():
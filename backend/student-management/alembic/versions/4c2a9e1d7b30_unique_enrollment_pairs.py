@@ -0,0 +1,36 @@
+"""unique index on enrollment (student_id, course_id)
+
+Revision ID: 4c2a9e1d7b30
+Revises: b3dd1f3606df
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c2a9e1d7b30'
+down_revision: Union[str, None] = 'b3dd1f3606df'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    if 'enrollments' not in inspector.get_table_names():
+        return
+    # Keep the earliest row of any duplicated pair so the unique index can be built
+    op.execute(
+        "DELETE FROM enrollments WHERE id NOT IN "
+        "(SELECT MIN(id) FROM enrollments GROUP BY student_id, course_id)"
+    )
+    op.create_index('ix_enrollments_student_course', 'enrollments', ['student_id', 'course_id'], unique=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_enrollments_student_course', table_name='enrollments', if_exists=True)
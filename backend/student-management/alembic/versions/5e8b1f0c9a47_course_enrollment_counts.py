@@ -0,0 +1,43 @@
+"""summary table of enrollments per course
+
+Revision ID: 5e8b1f0c9a47
+Revises: d7a3c5e8f214
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e8b1f0c9a47'
+down_revision: Union[str, None] = 'd7a3c5e8f214'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    tables = sa.inspect(op.get_bind()).get_table_names()
+    if 'courses' not in tables or 'course_enrollment_counts' in tables:
+        return
+    op.create_table(
+        'course_enrollment_counts',
+        sa.Column('course_id', sa.Integer(), sa.ForeignKey('courses.id'), primary_key=True),
+        sa.Column('enrollment_count', sa.Integer(), nullable=False),
+    )
+    op.create_index('ix_course_enrollment_counts_count', 'course_enrollment_counts', ['enrollment_count'], unique=False)
+    # Backfill every course, including those with no enrollments yet
+    op.execute(
+        "INSERT INTO course_enrollment_counts (course_id, enrollment_count) "
+        "SELECT courses.id, COUNT(enrollments.id) FROM courses "
+        "LEFT OUTER JOIN enrollments ON enrollments.course_id = courses.id GROUP BY courses.id"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_course_enrollment_counts_count', table_name='course_enrollment_counts', if_exists=True)
+    op.drop_table('course_enrollment_counts', if_exists=True)
@@ -0,0 +1,44 @@
+"""token versions on users and a revoked token table
+
+Revision ID: 8a1f3e7c2d94
+Revises: 2c7d4a9e6b13
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8a1f3e7c2d94'
+down_revision: Union[str, None] = '2c7d4a9e6b13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    tables = inspector.get_table_names()
+    if 'users' in tables and 'token_version' not in {c['name'] for c in inspector.get_columns('users')}:
+        with op.batch_alter_table('users') as batch_op:
+            batch_op.add_column(sa.Column('token_version', sa.Integer(), nullable=False, server_default='0'))
+            batch_op.create_index('ix_users_token_version', ['token_version'], unique=False)
+    if 'revoked_tokens' not in tables:
+        op.create_table(
+            'revoked_tokens',
+            sa.Column('jti', sa.String(), primary_key=True),
+            sa.Column('expires_at', sa.Float(), nullable=False),
+        )
+        op.create_index('ix_revoked_tokens_expires_at', 'revoked_tokens', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_revoked_tokens_expires_at', table_name='revoked_tokens', if_exists=True)
+    op.drop_table('revoked_tokens', if_exists=True)
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_index('ix_users_token_version')
+        batch_op.drop_column('token_version')
@@ -0,0 +1,54 @@
+"""FTS5 full-text index over students
+
+Revision ID: 9f1e6b2c4d85
+Revises: 4c2a9e1d7b30
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9f1e6b2c4d85'
+down_revision: Union[str, None] = '4c2a9e1d7b30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name != 'sqlite' or 'students' not in sa.inspect(bind).get_table_names():
+        return
+    op.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS students_fts USING fts5("
+        "name, email, content='students', content_rowid='id', prefix='2 3')"
+    )
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS students_fts_ai AFTER INSERT ON students BEGIN "
+        "INSERT INTO students_fts(rowid, name, email) VALUES (new.id, new.name, new.email); END"
+    )
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS students_fts_ad AFTER DELETE ON students BEGIN "
+        "INSERT INTO students_fts(students_fts, rowid, name, email) VALUES ('delete', old.id, old.name, old.email); END"
+    )
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS students_fts_au AFTER UPDATE ON students BEGIN "
+        "INSERT INTO students_fts(students_fts, rowid, name, email) VALUES ('delete', old.id, old.name, old.email); "
+        "INSERT INTO students_fts(rowid, name, email) VALUES (new.id, new.name, new.email); END"
+    )
+    # Index the rows that existed before the triggers
+    op.execute("INSERT INTO students_fts(students_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("DROP TRIGGER IF EXISTS students_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS students_fts_ad")
+    op.execute("DROP TRIGGER IF EXISTS students_fts_ai")
+    op.execute("DROP TABLE IF EXISTS students_fts")
@@ -20,13 +20,58 @@ depends_on: Union[str, Sequence[str], None] = None
 
 def upgrade() -> None:
     """Upgrade schema."""
-    # ### commands auto generated by Alembic - please adjust! ###
-    pass
-    # ### end Alembic commands ###
+    # Databases built by the old create_all() startup hook already have some or all
+    # of these tables; create only what is missing so they can be upgraded in place.
+    tables = sa.inspect(op.get_bind()).get_table_names()
+    if 'students' not in tables:
+        op.create_table(
+            'students',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(), nullable=True),
+            sa.Column('age', sa.Integer(), nullable=True),
+            sa.Column('email', sa.String(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_students_email', 'students', ['email'], unique=True)
+        op.create_index('ix_students_id', 'students', ['id'], unique=False)
+        op.create_index('ix_students_name', 'students', ['name'], unique=False)
+    if 'users' not in tables:
+        op.create_table(
+            'users',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('username', sa.String(), nullable=True),
+            sa.Column('hashed_password', sa.String(), nullable=True),
+            sa.Column('is_active', sa.Boolean(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_users_id', 'users', ['id'], unique=False)
+        op.create_index('ix_users_username', 'users', ['username'], unique=True)
+    if 'courses' not in tables:
+        op.create_table(
+            'courses',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('title', sa.String(), nullable=True),
+            sa.Column('description', sa.String(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_courses_id', 'courses', ['id'], unique=False)
+        op.create_index('ix_courses_title', 'courses', ['title'], unique=False)
+    if 'enrollments' not in tables:
+        op.create_table(
+            'enrollments',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('student_id', sa.Integer(), nullable=True),
+            sa.Column('course_id', sa.Integer(), nullable=True),
+            sa.ForeignKeyConstraint(['course_id'], ['courses.id']),
+            sa.ForeignKeyConstraint(['student_id'], ['students.id']),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_enrollments_id', 'enrollments', ['id'], unique=False)
 
 
 def downgrade() -> None:
     """Downgrade schema."""
-    # ### commands auto generated by Alembic - please adjust! ###
-    pass
-    # ### end Alembic commands ###
+    op.drop_table('enrollments')
+    op.drop_table('courses')
+    op.drop_table('users')
+    op.drop_table('students')
@@ -0,0 +1,30 @@
+"""index enrollments by course_id
+
+Revision ID: d7a3c5e8f214
+Revises: 9f1e6b2c4d85
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7a3c5e8f214'
+down_revision: Union[str, None] = '9f1e6b2c4d85'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if 'enrollments' not in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_index('ix_enrollments_course_id', 'enrollments', ['course_id'], unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_enrollments_course_id', table_name='enrollments', if_exists=True)
@@ -0,0 +1,72 @@
+# benchmarks/bench_bulk_import.py
+"""Compare crud.create_student in a loop against crud.bulk_create_students.
+
+Run from the student-management directory:
+    python benchmarks/bench_bulk_import.py --rows 5000 --chunk-size 500
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+
+from database import Base
+import crud
+import schemas
+
+async def _fresh_engine(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    return engine
+
+def _students(rows: int, prefix: str):
+    return [schemas.StudentCreate(name=f"Student {i}", age=18 + i % 10, email=f"{prefix}{i}@example.com") for i in range(rows)]
+
+async def bench_single_row(path: str, rows: int) -> float:
+    engine = await _fresh_engine(path)
+    students = _students(rows, "single")
+    start = time.perf_counter()
+    async with AsyncSession(engine, expire_on_commit=False) as db:
+        for student in students:
+            await crud.create_student(db, student)
+    elapsed = time.perf_counter() - start
+    await engine.dispose()
+    return elapsed
+
+async def bench_bulk(path: str, rows: int, chunk_size: int) -> float:
+    engine = await _fresh_engine(path)
+    students = list(enumerate(_students(rows, "bulk")))
+    start = time.perf_counter()
+    async with AsyncSession(engine, expire_on_commit=False) as db:
+        created, rejected = await crud.bulk_create_students(db, students, chunk_size=chunk_size)
+    elapsed = time.perf_counter() - start
+    assert len(created) == rows and not rejected
+    await engine.dispose()
+    return elapsed
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        single = await bench_single_row(path, args.rows)
+        bulk = await bench_bulk(path, args.rows, args.chunk_size)
+
+    print(f"rows={args.rows} chunk_size={args.chunk_size}")
+    print(f"single-row: {single:8.3f}s  {args.rows / single:10.0f} rows/s")
+    print(f"bulk:       {bulk:8.3f}s  {args.rows / bulk:10.0f} rows/s")
+    print(f"speedup:    {single / bulk:8.1f}x")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+# benchmarks/bench_creates.py
+"""Compare the old check/add/commit/refresh create path with INSERT ... RETURNING.
+
+The legacy path is reproduced inline (existence SELECT, ORM add, commit, refresh);
+the new path is the crud functions. Both run against a fresh file database and
+report statements per create and creates per second.
+
+Run from the student-management directory:
+    python benchmarks/bench_creates.py --rows 2000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+
+from database import Base
+import crud
+import models
+import schemas
+
+async def _fresh_engine(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    return engine
+
+async def legacy_create_student(db, student):
+    existing = await db.execute(select(models.Student).where(models.Student.email == student.email))
+    if existing.scalars().first():
+        raise crud.DuplicateEmailError("Email already registered")
+    db_student = models.Student(**student.model_dump())
+    db.add(db_student)
+    await db.commit()
+    await db.refresh(db_student)
+    await crud.cache.response_cache.invalidate(f"student:{db_student.id}", namespaces=("students",))
+    return db_student
+
+async def legacy_create_enrollment(db, enrollment):
+    if (await db.execute(select(models.Student).where(models.Student.id == enrollment.student_id))).first() is None:
+        raise LookupError("Student not found")
+    if (await db.execute(select(models.Course).where(models.Course.id == enrollment.course_id))).first() is None:
+        raise LookupError("Course not found")
+    db_enrollment = models.Enrollment(**enrollment.model_dump())
+    db.add(db_enrollment)
+    await db.commit()
+    await db.refresh(db_enrollment)
+    await crud.cache.response_cache.invalidate(*crud.enrollment_cache_keys(enrollment.student_id, enrollment.course_id))
+    return db_enrollment
+
+async def run(path: str, rows: int, create_student, create_enrollment):
+    engine = await _fresh_engine(path)
+    statements = 0
+
+    def count(*args):
+        nonlocal statements
+        statements += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count)
+    students = [schemas.StudentCreate(name=f"Student {i}", age=18 + i % 10, email=f"s{i}@example.com") for i in range(rows)]
+    timings = {}
+    async with AsyncSession(engine, expire_on_commit=False) as db:
+        course = await crud.create_course(db, schemas.CourseCreate(title="Bench", description="course"))
+        statements = 0
+        start = time.perf_counter()
+        ids = [(await create_student(db, student)).id for student in students]
+        timings["student"] = (time.perf_counter() - start, statements)
+
+        statements = 0
+        start = time.perf_counter()
+        for student_id in ids:
+            await create_enrollment(db, schemas.EnrollmentCreate(student_id=student_id, course_id=course.id))
+        timings["enrollment"] = (time.perf_counter() - start, statements)
+    await engine.dispose()
+    return timings
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        legacy = await run(path, args.rows, legacy_create_student, legacy_create_enrollment)
+        returning = await run(path, args.rows, crud.create_student, crud.create_enrollment)
+
+    for kind in ("student", "enrollment"):
+        for label, timings in (("legacy", legacy), ("returning", returning)):
+            elapsed, statements = timings[kind]
+            print(f"{kind:<11} {label:<10} {args.rows / elapsed:>8.0f} creates/s  "
+                  f"{statements / args.rows:.1f} statements/create")
+
+if __name__ == "__main__":
+    asyncio.run(main())
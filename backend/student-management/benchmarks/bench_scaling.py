@@ -0,0 +1,75 @@
+# benchmarks/bench_scaling.py
+"""Throughput of serve.py as the worker count grows from 1 to N.
+
+Seeds one scratch database, then for each worker count starts the launcher, waits
+for its ready file and runs the read scenarios from load_test.py against it:
+
+    python benchmarks/bench_scaling.py --max-workers 4 --requests 3000
+
+Scaling is bounded by the cores actually available (os.cpu_count() is printed
+with the results) and, for writes, by SQLite's single writer.
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from load_test import APP_DIR, PASSWORD, free_port, run_scenario, seed
+
+async def measure(base_url: str, student_ids, requests: int, concurrency: int):
+    rng = random.Random(7)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        token = (await client.post("/token", data={"username": "bench0", "password": PASSWORD})).json()["access_token"]
+        client.headers["Authorization"] = f"Bearer {token}"
+        return [
+            await run_scenario(client, "student_detail", lambda c, i: c.get(f"/students/{rng.choice(student_ids)}"), requests, concurrency),
+            await run_scenario(client, "students_list", lambda c, i: c.get("/students/", params={"limit": 100, "skip": i % 500 + 1}), requests, concurrency),
+        ]
+
+def start_launcher(workdir: str, workers: int, port: int, ready_file: str) -> subprocess.Popen:
+    env = {**os.environ, "PYTHONPATH": APP_DIR, "LOG_SAMPLE_RATE": "0", "RATE_LIMIT_ENABLED": "false"}
+    return subprocess.Popen(
+        [sys.executable, os.path.join(APP_DIR, "serve.py"), "--workers", str(workers), "--port", str(port),
+         "--ready-file", ready_file, "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL,
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--students", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        student_ids, _ = seed(os.path.join(workdir, "students.db"), args.students, 10, 100, 1)
+        print(f"cpus={os.cpu_count()}")
+        baseline = {}
+        for workers in range(1, args.max_workers + 1):
+            port, ready_file = free_port(), os.path.join(workdir, "ready")
+            launcher = start_launcher(workdir, workers, port, ready_file)
+            try:
+                deadline = time.monotonic() + 120
+                while not os.path.exists(ready_file):
+                    if launcher.poll() is not None or time.monotonic() > deadline:
+                        raise RuntimeError("launcher did not become ready")
+                    time.sleep(0.2)
+                results = asyncio.run(measure(f"http://127.0.0.1:{port}", student_ids, args.requests, args.concurrency))
+            finally:
+                launcher.terminate()
+                launcher.wait(timeout=120)
+            for result in results:
+                base = baseline.setdefault(result["scenario"], result["rps"])
+                print(f"workers={workers}  {result['scenario']:<15} rps={result['rps']:>8}  x{result['rps'] / base:.2f}  "
+                      f"p99={result['p99_ms']:>8}ms  errors={result['errors']}")
+
+if __name__ == "__main__":
+    main()
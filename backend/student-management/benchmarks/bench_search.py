@@ -0,0 +1,74 @@
+# benchmarks/bench_search.py
+"""Compare the ILIKE search path with the FTS5 ranked search, per search term.
+
+ILIKE can stop early once it finds `limit` matches for a common term, but
+rare or missing terms scan the whole table. FTS5 reads only matching rows,
+then ranks all of them.
+
+Seeds 1,000,000 students by default; pass a smaller --rows for a quick run.
+Run from the student-management directory:
+    python benchmarks/bench_search.py
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+
+from database import Base
+import crud
+import models
+
+FIRST = ["Ada", "Alan", "Grace", "Linus", "Barbara", "Edsger", "Donald", "Margaret", "Ken", "Frances"]
+LAST = ["Lovelace", "Turing", "Hopper", "Torvalds", "Liskov", "Dijkstra", "Knuth", "Hamilton", "Thompson", "Allen"]
+TERMS = ["ada", "turi", "hopper", "liskov", "knu", "marg", "student12345", "zzz"]
+
+def seed(path: str, rows: int, batch: int = 50000):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    rng = random.Random(42)
+    with engine.begin() as conn:
+        for start in range(0, rows, batch):
+            conn.execute(insert(models.Student), [
+                {"name": f"{rng.choice(FIRST)} {rng.choice(LAST)}", "age": 18 + i % 10, "email": f"student{i}@example.com"}
+                for i in range(start, min(rows, start + batch))
+            ])
+    engine.dispose()
+
+async def time_search(db, search, term: str, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await search(db, term)
+    return (time.perf_counter() - start) / repeat
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        start = time.perf_counter()
+        seed(path, args.rows)
+        print(f"seeded {args.rows} students in {time.perf_counter() - start:.1f}s")
+
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        print(f"{'term':<14}{'ILIKE ms':>10}{'FTS5 ms':>10}{'speedup':>9}")
+        async with AsyncSession(engine) as db:
+            for term in TERMS:
+                ilike = await time_search(db, lambda db, t: crud.search_students(db, t, limit=args.limit), term, args.repeat)
+                fts = await time_search(db, lambda db, t: crud.search_students_ranked(db, t, limit=args.limit), term, args.repeat)
+                print(f"{term:<14}{ilike * 1000:10.2f}{fts * 1000:10.2f}{ilike / fts:8.1f}x")
+        await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+# benchmarks/bench_serialization.py
+"""Time building a 10k-row student list response: ORM + Pydantic + json versus rows + orjson.
+
+Paths measured (best of --repeat runs, fetch and serialize timed separately):
+  orm_stdlib_json   ORM instances -> per-object model_validate -> jsonable_encoder -> json.dumps
+  orm_type_adapter  ORM instances -> TypeAdapter(list[Student]) validate + dump_json
+  rows_orjson       column Row tuples -> orjson.dumps (what GET /students/ does now)
+
+Run from the student-management directory:
+    python benchmarks/bench_serialization.py --rows 10000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from database import Base
+import crud
+import models
+import schemas
+
+student_list = TypeAdapter(list[schemas.Student])
+
+def orm_stdlib_json(db):
+    students = db.scalars(select(models.Student).order_by(models.Student.id)).all()
+    start = time.perf_counter()
+    body = json.dumps(jsonable_encoder([schemas.Student.model_validate(s, from_attributes=True) for s in students])).encode()
+    return start, body
+
+def orm_type_adapter(db):
+    students = db.scalars(select(models.Student).order_by(models.Student.id)).all()
+    start = time.perf_counter()
+    return start, student_list.dump_json(student_list.validate_python(students, from_attributes=True))
+
+def rows_orjson(db):
+    rows = db.execute(select(*crud.STUDENT_ROW_COLUMNS).order_by(models.Student.id)).all()
+    start = time.perf_counter()
+    return start, orjson.dumps([row._asdict() for row in rows])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(models.Student), [
+            {"name": f"Student {i}", "age": 18 + i % 10, "email": f"student{i}@example.com"} for i in range(args.rows)
+        ])
+
+    bodies = {}
+    for path in (orm_stdlib_json, orm_type_adapter, rows_orjson):
+        best_total = best_serialize = float("inf")
+        for _ in range(args.repeat):
+            with Session(engine) as db:
+                begin = time.perf_counter()
+                start, body = path(db)
+                end = time.perf_counter()
+            best_total = min(best_total, end - begin)
+            best_serialize = min(best_serialize, end - start)
+        bodies[path.__name__] = json.loads(body)
+        print(f"{path.__name__:<17} total {best_total * 1000:8.1f}ms  serialize {best_serialize * 1000:8.1f}ms  {len(body)} bytes")
+    assert len({json.dumps(body) for body in bodies.values()}) == 1, "paths produced different JSON"
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# benchmarks/bench_startup.py
+"""Measure cold start: interpreter + `import main`, app startup and the first requests.
+
+Each run is a fresh Python process against a migrated scratch database, so module
+imports, engine creation and startup hooks are all paid again, as they are when a
+new container or worker comes up. Reports the median of --runs:
+
+    python benchmarks/bench_startup.py --runs 10
+
+Pass --app-dir to time another checkout (e.g. a git worktree of an older commit)
+against the same harness.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    started = time.perf_counter()
+    assert client.get("/health").status_code == 200
+    health = time.perf_counter()
+    client.get("/students/")  # unauthenticated: exercises routing and the auth dependency only
+    client.post("/token", data={"username": "nobody", "password": "x"})  # first database query
+    first_query = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "startup_ms": (started - imported) * 1000,
+    "first_request_ms": (health - started) * 1000,
+    "first_query_ms": (first_query - health) * 1000,
+    "total_ms": (first_query - start) * 1000,
+}))
+"""
+
+def run_once(app_dir: str, workdir: str, db_url: str) -> dict:
+    env = {**os.environ, "PYTHONPATH": app_dir, "DATABASE_URL": db_url, "LOG_SAMPLE_RATE": "0", "RATE_LIMIT_ENABLED": "false"}
+    out = subprocess.run([sys.executable, "-c", CHILD], cwd=workdir, env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--app-dir", default=APP_DIR, help="student-management directory to time")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_url = f"sqlite+aiosqlite:///{os.path.join(workdir, 'students.db')}"
+        subprocess.run([sys.executable, "-m", "alembic", "upgrade", "head"], cwd=args.app_dir,
+                       env={**os.environ, "DATABASE_URL": db_url}, check=True, capture_output=True)
+        runs = [run_once(args.app_dir, workdir, db_url) for _ in range(args.runs)]
+
+    for field in ("import_ms", "startup_ms", "first_request_ms", "first_query_ms", "total_ms"):
+        values = [run[field] for run in runs]
+        print(f"{field:<17} median {statistics.median(values):8.1f}ms  min {min(values):8.1f}ms  max {max(values):8.1f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# benchmarks/load_login.py
+"""Measure /token latency and the latency of an unrelated endpoint during a login burst.
+
+With bcrypt on the event loop, /health latency tracks /token latency; with the
+worker pool it should stay close to its idle baseline.
+
+Run from the student-management directory:
+    python benchmarks/load_login.py --logins 200 --concurrency 20
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Every simulated login comes from one address; measure hashing, not the limiter
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+import httpx
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+
+from database import Base, get_db
+from main import app
+import passwords
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def summary(name, samples):
+    ms = [s * 1000 for s in samples]
+    return f"{name:<18} n={len(ms):<5} p50={percentile(ms, 50):8.1f}ms  p99={percentile(ms, 99):8.1f}ms  mean={statistics.mean(ms):8.1f}ms"
+
+async def timed(client, method, url, **kwargs):
+    start = time.perf_counter()
+    response = await client.request(method, url, **kwargs)
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+async def probe_health(client, stop: asyncio.Event, samples: list):
+    while not stop.is_set():
+        samples.append(await timed(client, "GET", "/health"))
+        await asyncio.sleep(0.005)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        async def override_get_db():
+            async with AsyncSession(engine, expire_on_commit=False) as session:
+                yield session
+
+        app.dependency_overrides[get_db] = override_get_db
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            (await client.post("/users/", json={"username": "bench", "password": "benchpass"})).raise_for_status()
+
+            idle = [await timed(client, "GET", "/health") for _ in range(200)]
+
+            stop = asyncio.Event()
+            health_samples, token_samples = [], []
+            prober = asyncio.create_task(probe_health(client, stop, health_samples))
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def login():
+                async with semaphore:
+                    token_samples.append(await timed(client, "POST", "/token", data={"username": "bench", "password": "benchpass"}))
+
+            start = time.perf_counter()
+            await asyncio.gather(*(login() for _ in range(args.logins)))
+            elapsed = time.perf_counter() - start
+            stop.set()
+            await prober
+
+        app.dependency_overrides.clear()
+        await engine.dispose()
+
+    print(f"executor={passwords.PASSWORD_HASH_EXECUTOR} workers={passwords.PASSWORD_HASH_WORKERS} "
+          f"max_concurrency={passwords.PASSWORD_HASH_MAX_CONCURRENCY}")
+    print(summary("/health idle", idle))
+    print(summary("/health under load", health_samples))
+    print(summary("/token", token_samples))
+    print(f"logins/s: {args.logins / elapsed:.1f}  max queue depth: {passwords.stats()['max_waiting']}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
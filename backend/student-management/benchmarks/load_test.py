@@ -0,0 +1,231 @@
+# benchmarks/load_test.py
+"""Seed a database, serve the real app under uvicorn and load each endpoint.
+
+Each scenario runs for a fixed number of requests at a fixed concurrency and
+reports RPS and p50/p95/p99 latency. Results are written as JSON so runs can
+be compared between commits:
+
+    python benchmarks/load_test.py --students 50000 --output before.json
+    python benchmarks/load_test.py --students 50000 --compare before.json
+
+Run from the student-management directory. The database is seeded in a
+scratch directory (or --workdir), never in the checked-in students.db.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+import httpx
+from sqlalchemy import create_engine, insert, select
+
+from database import Base
+import models
+
+PASSWORD = "benchpass"
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def seed(db_path: str, students: int, courses: int, enrollments: int, users: int, batch: int = 20000):
+    from passlib.context import CryptContext
+
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(engine)
+    rng = random.Random(1234)
+    hashed = CryptContext(schemes=["bcrypt"]).hash(PASSWORD)
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [
+            {"username": f"bench{i}", "hashed_password": hashed, "is_active": True} for i in range(users)
+        ])
+        for start in range(0, students, batch):
+            conn.execute(insert(models.Student), [
+                {"name": f"Student {i:07d}", "age": 18 + i % 12, "email": f"seed{i}@example.com"}
+                for i in range(start, min(students, start + batch))
+            ])
+        conn.execute(insert(models.Course), [
+            {"title": f"Course {i}", "description": f"Description of course {i}"} for i in range(courses)
+        ])
+        student_ids = conn.execute(select(models.Student.id)).scalars().all()
+        course_ids = conn.execute(select(models.Course.id)).scalars().all()
+        pairs = set()
+        while len(pairs) < min(enrollments, len(student_ids) * len(course_ids)):
+            pairs.add((rng.choice(student_ids), rng.choice(course_ids)))
+        pairs = list(pairs)
+        for start in range(0, len(pairs), batch):
+            conn.execute(insert(models.Enrollment), [
+                {"student_id": s, "course_id": c} for s, c in pairs[start:start + batch]
+            ])
+    engine.dispose()
+    return student_ids, course_ids
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(workdir: str, port: int, extra_env: dict) -> subprocess.Popen:
+    env = {**os.environ, "PYTHONPATH": APP_DIR, "LOG_SAMPLE_RATE": "0", **extra_env}
+    # database.py and logging_config.py use paths relative to the working directory
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL,
+    )
+
+async def wait_ready(base_url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError("server did not become ready")
+
+async def run_scenario(client, name, make_request, requests: int, concurrency: int, ok_statuses=(200,)):
+    latencies, errors = [], 0
+    queue = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in queue:
+            start = time.perf_counter()
+            try:
+                response = await make_request(client, i)
+                if response.status_code not in ok_statuses:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    ms = [l * 1000 for l in latencies]
+    return {
+        "scenario": name,
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(ms, 50), 2),
+        "p95_ms": round(percentile(ms, 95), 2),
+        "p99_ms": round(percentile(ms, 99), 2),
+    }
+
+async def run_all(base_url, args, student_ids, course_ids):
+    rng = random.Random(99)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        token = (await client.post("/token", data={"username": "bench0", "password": PASSWORD})).json()["access_token"]
+        client.headers["Authorization"] = f"Bearer {token}"
+
+        scenarios = [
+            ("token", lambda c, i: c.post("/token", data={"username": f"bench{i % args.users}", "password": PASSWORD}),
+             max(1, args.requests // 10), (200,)),
+            ("students_list", lambda c, i: c.get("/students/", params={"limit": 100}), args.requests, (200,)),
+            ("student_detail", lambda c, i: c.get(f"/students/{rng.choice(student_ids)}"), args.requests, (200,)),
+            ("student_create", lambda c, i: c.post("/students/", json={"name": f"Load {i}", "age": 20, "email": f"load{i}-{time.time_ns()}@example.com"}),
+             args.requests, (201,)),
+            # Random pairs can repeat, so "already enrolled" is an expected outcome
+            ("enrollment_create", lambda c, i: c.post("/enrollments", json={"student_id": rng.choice(student_ids), "course_id": rng.choice(course_ids)}),
+             args.requests, (200, 400)),
+            ("student_courses", lambda c, i: c.get(f"/students/{rng.choice(student_ids)}/courses/"), args.requests, (200,)),
+        ]
+        selected = set(args.scenarios.split(",")) if args.scenarios else None
+        results = []
+        for name, make_request, requests, ok in scenarios:
+            if selected and name not in selected:
+                continue
+            result = await run_scenario(client, name, make_request, requests, args.concurrency, ok)
+            results.append(result)
+            print(f"{name:<18} rps={result['rps']:>8}  p50={result['p50_ms']:>8}ms  p95={result['p95_ms']:>8}ms  "
+                  f"p99={result['p99_ms']:>8}ms  errors={result['errors']}")
+        return results
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {r["scenario"]: r for r in json.load(f)["results"]}
+    print(f"\ncompared with {baseline_path}:")
+    for result in results:
+        before = baseline.get(result["scenario"])
+        if not before:
+            continue
+        print(f"{result['scenario']:<18} rps {before['rps']:>8} -> {result['rps']:>8} ({result['rps'] / before['rps'] - 1:+.0%})  "
+              f"p99 {before['p99_ms']:>8} -> {result['p99_ms']:>8}ms ({result['p99_ms'] / before['p99_ms'] - 1:+.0%})")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=10000)
+    parser.add_argument("--courses", type=int, default=200)
+    parser.add_argument("--enrollments", type=int, default=30000)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per scenario (/token runs a tenth of this)")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--scenarios", help="comma-separated subset of scenarios to run")
+    parser.add_argument("--workdir", help="directory for the seeded database and server logs")
+    parser.add_argument("--rate-limit", action="store_true", help="keep rate limiting on (all load comes from one address)")
+    parser.add_argument("--output", help="write JSON results to this path")
+    parser.add_argument("--compare", help="print deltas against an earlier JSON result")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        workdir = args.workdir or scratch
+        os.makedirs(workdir, exist_ok=True)
+        db_path = os.path.join(workdir, "students.db")
+        if os.path.exists(db_path):
+            os.remove(db_path)
+        start = time.perf_counter()
+        student_ids, course_ids = seed(db_path, args.students, args.courses, args.enrollments, args.users)
+        print(f"seeded {args.students} students, {args.courses} courses, {args.enrollments} enrollments "
+              f"in {time.perf_counter() - start:.1f}s")
+
+        port = free_port()
+        server = start_server(workdir, port, {} if args.rate_limit else {"RATE_LIMIT_ENABLED": "false"})
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            await wait_ready(base_url)
+            results = await run_all(base_url, args, student_ids, course_ids)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "params": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "workdir")},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"wrote {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,219 @@
+# cache.py
+import hashlib
+import json
+import secrets
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from config import (
+    AUTH_CACHE_TTL_SECONDS, AUTH_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_BACKEND, RESPONSE_CACHE_URL, RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_MAX_ENTRIES,
+)
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after a TTL."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """Like get, but not counted as a hit or miss and without refreshing recency."""
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.time():
+            return None
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, expires_at: Optional[float] = None):
+        default_expiry = time.time() + self.ttl
+        expires_at = default_expiry if expires_at is None else min(expires_at, default_expiry)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def delete_where(self, predicate):
+        for key in [key for key, (_, value) in self._data.items() if predicate(value)]:
+            del self._data[key]
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
+
+# Validated access tokens -> schemas.User, and username -> schemas.User
+token_cache = TTLCache(AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_TTL_SECONDS)
+user_cache = TTLCache(AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_TTL_SECONDS)
+
+def invalidate_user(username: str):
+    user_cache.delete(username)
+    token_cache.delete_where(lambda user: user.username == username)
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: str
+    headers: Dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def from_body(cls, body: bytes, headers: Optional[Dict[str, str]] = None) -> "CachedResponse":
+        return cls(body=body, etag=f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"', headers=headers or {})
+
+class MemoryBackend:
+    """Per-process LRU; each worker keeps its own copy."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self._entries = TTLCache(max_entries, ttl)
+        self._generations: Dict[str, int] = {}
+        self._changed_at: Dict[str, float] = {}
+        # Counters restart at 0 with the process; the epoch keeps old validators from matching
+        self._epoch = secrets.token_hex(4)
+        self._started_at = time.time()
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        return self._entries.get(key)
+
+    async def set(self, key: str, value: CachedResponse):
+        self._entries.set(key, value)
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._entries.delete(key)
+
+    async def bump(self, namespace: str):
+        self._generations[namespace] = self._generations.get(namespace, 0) + 1
+        self._changed_at[namespace] = time.time()
+
+    async def version(self, namespace: str) -> Tuple[int, str, float]:
+        """(generation, epoch, time of the last bump)."""
+        return self._generations.get(namespace, 0), self._epoch, self._changed_at.get(namespace, self._started_at)
+
+    def stats(self) -> dict:
+        return self._entries.stats()
+
+class RedisBackend:
+    """Shared cache in a Redis-compatible server, so every worker sees the same entries."""
+
+    def __init__(self, url: str, ttl: float, prefix: str = "sm:"):
+        # Imported on demand: redis.asyncio adds ~60ms to every cold start that never uses it
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError:
+            raise RuntimeError("RESPONSE_CACHE_BACKEND=redis requires the 'redis' package")
+        self._client = redis_asyncio.from_url(url)
+        self._ttl = int(ttl)
+        self._prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        raw = await self._client.get(self._prefix + key)
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        data = json.loads(raw)
+        return CachedResponse(body=data["body"].encode(), etag=data["etag"], headers=data["headers"])
+
+    async def set(self, key: str, value: CachedResponse):
+        raw = json.dumps({"body": value.body.decode(), "etag": value.etag, "headers": value.headers})
+        await self._client.set(self._prefix + key, raw, ex=self._ttl)
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self._client.delete(*(self._prefix + key for key in keys))
+
+    async def bump(self, namespace: str):
+        async with self._client.pipeline(transaction=True) as pipe:
+            pipe.incr(f"{self._prefix}gen:{namespace}")
+            pipe.set(f"{self._prefix}changed:{namespace}", repr(time.time()))
+            await pipe.execute()
+
+    async def version(self, namespace: str) -> Tuple[int, str, float]:
+        """(generation, epoch, time of the last bump); the epoch is replaced if Redis loses its data."""
+        keys = (f"{self._prefix}gen:{namespace}", f"{self._prefix}changed:{namespace}", f"{self._prefix}epoch")
+        generation, changed_at, epoch = await self._client.mget(keys)
+        if epoch is None:
+            await self._client.set(keys[2], f"{secrets.token_hex(4)}:{time.time()!r}", nx=True)
+            epoch = await self._client.get(keys[2])
+        epoch, _, started_at = epoch.decode().partition(":")
+        return int(generation or 0), epoch, float(changed_at or started_at)
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "hits": self.hits, "misses": self.misses}
+
+@dataclass
+class Validators:
+    """Conditional GET validators for a list namespace, derived from its change counter."""
+    generation: int
+    etag: str
+    last_modified: float
+
+class ResponseCache:
+    """Read-through cache of serialized JSON response bodies.
+
+    Single records are cached under fixed keys and deleted on write. List pages
+    are keyed under a namespace generation that writes bump, which invalidates
+    every page at once without enumerating keys. The same generation is the
+    list's ETag, so an unchanged page can be answered 304 without loading it.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Optional[CachedResponse]]]) -> Optional[CachedResponse]:
+        entry = await self.backend.get(key)
+        if entry is None:
+            entry = await loader()
+            if entry is not None:
+                await self.backend.set(key, entry)
+        return entry
+
+    async def validators(self, namespace: str) -> Validators:
+        generation, epoch, changed_at = await self.backend.version(namespace)
+        return Validators(generation, f'W/"{namespace}-{epoch}-{generation}"', changed_at)
+
+    @staticmethod
+    def page_key(namespace: str, generation: int, *parts) -> str:
+        return f"{namespace}:list:{generation}:" + ":".join(str(part) for part in parts)
+
+    async def invalidate(self, *keys: str, namespaces=()):
+        await self.backend.delete(*keys)
+        for namespace in namespaces:
+            await self.backend.bump(namespace)
+
+    def stats(self) -> dict:
+        return self.backend.stats()
+
+def _build_backend():
+    if RESPONSE_CACHE_BACKEND == "redis":
+        return RedisBackend(RESPONSE_CACHE_URL, RESPONSE_CACHE_TTL_SECONDS)
+    return MemoryBackend(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL_SECONDS)
+
+response_cache = ResponseCache(_build_backend())
+
+def stats() -> dict:
+    return {"token_cache": token_cache.stats(), "user_cache": user_cache.stats(), "response_cache": response_cache.stats()}
@@ -0,0 +1,63 @@
+# compression.py
+"""Content negotiation and compression for JSON and text response bodies.
+
+Brotli is used when the `brotli` package is installed and the client accepts it,
+otherwise gzip. Bodies of COMPRESSION_THREAD_MIN_BYTES or more are compressed on a
+worker thread so one large page does not stall every other request on the loop.
+"""
+import asyncio
+import gzip
+from typing import Optional
+
+from config import settings
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+def accepted(accept_encoding: str) -> dict:
+    """Content codings from an Accept-Encoding header mapped to their q-values."""
+    codings = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding] = q
+    return codings
+
+def quality(codings: dict, coding: str) -> float:
+    return codings.get(coding, codings.get("*", 0.0))
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """"br" or "gzip", whichever the client weights higher (br on a tie); None for neither."""
+    codings = accepted(accept_encoding)
+    candidates = [("gzip", quality(codings, "gzip"))]
+    if brotli is not None:
+        candidates.insert(0, ("br", quality(codings, "br")))
+    coding, q = max(candidates, key=lambda candidate: candidate[1])
+    return coding if q > 0 else None
+
+def compressible(content_type: str) -> bool:
+    media_type = content_type.split(";")[0].strip().lower()
+    return media_type.startswith("text/") or media_type == "application/json" or media_type.endswith("+json")
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    # mtime=0 keeps the output identical for identical bodies
+    return gzip.compress(body, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+async def compress(body: bytes, encoding: str) -> bytes:
+    if len(body) >= settings.COMPRESSION_THREAD_MIN_BYTES:
+        return await asyncio.to_thread(_compress, body, encoding)
+    return _compress(body, encoding)
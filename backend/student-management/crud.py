@@ -1,15 +1,16 @@
 # crud.py
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import Session
 from sqlalchemy.future import select
-from sqlalchemy import or_
-from passlib.context import CryptContext
-from typing import Union
+import re
+from sqlalchemy import or_, and_, insert, update, delete, tuple_, table, column, bindparam, func, Integer
+from sqlalchemy.engine import Row
+from sqlalchemy.exc import IntegrityError
+from typing import AsyncIterator, List, Optional, Tuple
 from fastapi import HTTPException
 import models
 import schemas
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+import cache
+import passwords
 
 class DuplicateEmailError(Exception):
     pass
@@ -17,110 +18,405 @@ class DuplicateEmailError(Exception):
 class DuplicateUsernameError(Exception):
     pass
 
-async def get_student(db: Union[AsyncSession, Session], student_id: int):
-    if isinstance(db, AsyncSession):
-        result = await db.execute(select(models.Student).filter(models.Student.id == student_id))
-    else:
-        result = db.execute(select(models.Student).filter(models.Student.id == student_id))
+class EnrollmentConflictError(Exception):
+    pass
+
+class StudentImportConflictError(Exception):
+    pass
+
+# Statements are built once with bind parameters and reused, so each call skips
+# query construction and hits SQLAlchemy's compiled cache on the same object.
+_student_by_id = select(models.Student).where(models.Student.id == bindparam("student_id"))
+# List endpoints select plain columns, in schemas.Student field order, so rows can be
+# serialized straight to JSON without building ORM instances or validating them again.
+STUDENT_ROW_COLUMNS = (models.Student.name, models.Student.age, models.Student.email, models.Student.id)
+_students_by_offset = (
+    select(*STUDENT_ROW_COLUMNS).order_by(models.Student.id)
+    .offset(bindparam("skip", type_=Integer)).limit(bindparam("limit", type_=Integer))
+)
+_user_by_username = select(models.User).where(models.User.username == bindparam("username"))
+_course_by_id = select(models.Course).where(models.Course.id == bindparam("course_id"))
+_student_exists = select(models.Student.id).where(models.Student.id == bindparam("student_id"))
+
+# Creates are a single INSERT ... RETURNING: unique indexes reject duplicates and the
+# returned row populates the ORM object, so there is no pre-check SELECT or refresh().
+_insert_student = insert(models.Student).returning(models.Student)
+_insert_user = insert(models.User).returning(models.User)
+_insert_course = insert(models.Course).returning(models.Course)
+# Inserts nothing (no row returned) when either side of the enrollment is missing
+_insert_enrollment = insert(models.Enrollment).from_select(
+    ["student_id", "course_id"],
+    select(bindparam("student_id", type_=Integer), bindparam("course_id", type_=Integer)).where(
+        select(models.Student.id).where(models.Student.id == bindparam("student_id")).exists(),
+        select(models.Course.id).where(models.Course.id == bindparam("course_id")).exists(),
+    ),
+).returning(models.Enrollment).execution_options(dml_strategy="raw")
+
+# course_enrollment_counts gets a zero row with each course and is bumped in the same
+# transaction as every enrollment insert, so count reads never aggregate enrollments.
+_enrollment_counts = models.CourseEnrollmentCount.__table__
+_insert_course_count = insert(_enrollment_counts).values(course_id=bindparam("course_id"), enrollment_count=0)
+_add_to_course_count = (
+    update(_enrollment_counts)
+    .where(_enrollment_counts.c.course_id == bindparam("counted_course_id"))
+    .values(enrollment_count=_enrollment_counts.c.enrollment_count + bindparam("added", type_=Integer))
+)
+
+# Keyset queries seek past the last row seen instead of OFFSET, so every page is an index range scan.
+_students_keyset = {
+    ("id", False): select(*STUDENT_ROW_COLUMNS).order_by(models.Student.id),
+    ("id", True): select(*STUDENT_ROW_COLUMNS).where(models.Student.id > bindparam("after_id")).order_by(models.Student.id),
+    ("name", False): select(*STUDENT_ROW_COLUMNS).order_by(models.Student.name, models.Student.id),
+    ("name", True): select(*STUDENT_ROW_COLUMNS).where(or_(
+        models.Student.name > bindparam("after_name"),
+        and_(models.Student.name == bindparam("after_name"), models.Student.id > bindparam("after_id")),
+    )).order_by(models.Student.name, models.Student.id),
+}
+
+def _keyset_params(after: Optional[dict]) -> dict:
+    if after is None:
+        return {}
+    return {"after_id": after["id"], "after_name": after.get("name")}
+
+async def get_student(db: AsyncSession, student_id: int):
+    result = await db.execute(_student_by_id, {"student_id": student_id})
     return result.scalars().first()
 
-async def get_students(db: Union[AsyncSession, Session], skip: int = 0, limit: int = 100):
-    if isinstance(db, AsyncSession):
-        result = await db.execute(select(models.Student).offset(skip).limit(limit))
-    else:
-        result = db.execute(select(models.Student).offset(skip).limit(limit))
-    return result.scalars().all()
+async def get_students(db: AsyncSession, skip: int = 0, limit: int = 100):
+    result = await db.execute(_students_by_offset, {"skip": skip, "limit": limit})
+    return result.all()
 
-async def create_student(db: Union[AsyncSession, Session], student: schemas.StudentCreate):
-    if isinstance(db, AsyncSession):
-        existing = await db.execute(select(models.Student).filter(models.Student.email == student.email))
-    else:
-        existing = db.execute(select(models.Student).filter(models.Student.email == student.email))
-    if existing.scalars().first():
-        raise DuplicateEmailError("Email already registered")
-    db_student = models.Student(**student.dict())
-    db.add(db_student)
-    if isinstance(db, AsyncSession):
+async def get_students_after(db: AsyncSession, after: Optional[dict] = None, limit: int = 100, order_by: str = "id"):
+    query = _students_keyset[(order_by, after is not None)].limit(limit)
+    result = await db.execute(query, _keyset_params(after))
+    return result.all()
+
+async def stream_students(db: AsyncSession, after: Optional[dict] = None, order_by: str = "id", batch_size: int = 500) -> AsyncIterator[Row]:
+    query = _students_keyset[(order_by, after is not None)].execution_options(yield_per=batch_size)
+    result = await db.stream(query, _keyset_params(after))
+    async for student in result:
+        yield student
+
+async def create_student(db: AsyncSession, student: schemas.StudentCreate):
+    try:
+        db_student = (await db.scalars(_insert_student, [student.model_dump()])).one()
         await db.commit()
-        await db.refresh(db_student)
-    else:
-        db.commit()
-        db.refresh(db_student)
+    except IntegrityError:
+        await db.rollback()
+        raise DuplicateEmailError("Email already registered")
+    await cache.response_cache.invalidate(f"student:{db_student.id}", namespaces=("students",))
     return db_student
 
-async def get_user_by_username(db: Union[AsyncSession, Session], username: str):
-    if isinstance(db, AsyncSession):
-        result = await db.execute(select(models.User).filter(models.User.username == username))
-    else:
-        result = db.execute(select(models.User).filter(models.User.username == username))
+async def bulk_create_students(db: AsyncSession, students: List[Tuple[int, schemas.StudentCreate]], chunk_size: int = 500):
+    """Insert (row, student) pairs in chunks inside one transaction.
+
+    Returns (created, rejected) where created holds (row, id) and rejected holds (row, reason).
+    """
+    created, rejected = [], []
+    seen_emails = set()
+    for start in range(0, len(students), chunk_size):
+        chunk = students[start:start + chunk_size]
+        emails = {student.email for _, student in chunk}
+        query = select(models.Student.email).where(models.Student.email.in_(emails))
+        existing = set((await db.execute(query)).scalars().all())
+        rows, row_numbers = [], []
+        for row, student in chunk:
+            if student.email in existing or student.email in seen_emails:
+                rejected.append((row, "Email already registered"))
+                continue
+            seen_emails.add(student.email)
+            rows.append(student.model_dump())
+            row_numbers.append(row)
+        if not rows:
+            continue
+        stmt = insert(models.Student).returning(models.Student.id, sort_by_parameter_order=True)
+        try:
+            ids = (await db.execute(stmt, rows)).scalars().all()
+        except IntegrityError:
+            # A concurrent request registered one of the emails after the check above
+            await db.rollback()
+            raise StudentImportConflictError("Student import conflicted with a concurrent write; retry")
+        created.extend(zip(row_numbers, ids))
+    await db.commit()
+    if created:
+        await cache.response_cache.invalidate(namespaces=("students",))
+    return created, rejected
+
+async def get_user_by_username(db: AsyncSession, username: str):
+    result = await db.execute(_user_by_username, {"username": username})
     return result.scalars().first()
 
-async def create_user(db: Union[AsyncSession, Session], user: schemas.UserCreate):
-    if isinstance(db, AsyncSession):
-        existing = await db.execute(select(models.User).filter(models.User.username == user.username))
-    else:
-        existing = db.execute(select(models.User).filter(models.User.username == user.username))
-    if existing.scalars().first():
-        raise DuplicateUsernameError("Username already registered")
-    hashed_password = pwd_context.hash(user.password)
-    db_user = models.User(username=user.username, hashed_password=hashed_password, is_active=True)
-    db.add(db_user)
-    if isinstance(db, AsyncSession):
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
+    hashed_password = await passwords.hash_password(user.password)
+    row = {"username": user.username, "hashed_password": hashed_password, "is_active": True, "token_version": 0}
+    try:
+        db_user = (await db.scalars(_insert_user, [row])).one()
         await db.commit()
-        await db.refresh(db_user)
-    else:
-        db.commit()
-        db.refresh(db_user)
+    except IntegrityError:
+        await db.rollback()
+        raise DuplicateUsernameError("Username already registered")
+    cache.invalidate_user(db_user.username)
     return db_user
 
-async def search_students(db: Union[AsyncSession, Session], search_term: str, skip: int = 0, limit: int = 100):
+# Revocation: revoked_tokens holds single token ids until they expire, and bumping
+# users.token_version revokes every token issued to that user before the bump.
+_revoked_tokens = models.RevokedToken.__table__
+_users = models.User.__table__
+_insert_revoked_token = insert(_revoked_tokens).values(jti=bindparam("jti"), expires_at=bindparam("expires_at"))
+_bump_token_version = (
+    update(_users).where(_users.c.id == bindparam("user_id"))
+    .values(token_version=_users.c.token_version + 1).returning(_users.c.token_version)
+)
+
+async def revoke_token(db: AsyncSession, jti: str, expires_at: float) -> bool:
+    """Record a token id as revoked; returns False if it already was."""
+    try:
+        await db.execute(_insert_revoked_token, {"jti": jti, "expires_at": expires_at})
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        return False
+    return True
+
+async def bump_token_version(db: AsyncSession, user_id: int) -> int:
+    version = (await db.execute(_bump_token_version, {"user_id": user_id})).scalar_one()
+    await db.commit()
+    return version
+
+async def get_revocations(db: AsyncSession, now: float):
+    """Drop expired revocations, then return ({jti: expiry}, {user id: token_version}) for users with a bumped version."""
+    await db.execute(delete(_revoked_tokens).where(_revoked_tokens.c.expires_at < now))
+    await db.commit()
+    jtis = (await db.execute(select(_revoked_tokens.c.jti, _revoked_tokens.c.expires_at))).all()
+    versions = (await db.execute(select(_users.c.id, _users.c.token_version).where(_users.c.token_version > 0))).all()
+    return dict(jtis), dict(versions)
+
+async def search_students(db: AsyncSession, search_term: str, skip: int = 0, limit: int = 100):
     query = select(models.Student).where(
         or_(models.Student.name.ilike(f"%{search_term}%"), models.Student.email.ilike(f"%{search_term}%"))
     ).offset(skip).limit(limit)
-    if isinstance(db, AsyncSession):
-        result = await db.execute(query)
-    else:
-        result = db.execute(query)
+    result = await db.execute(query)
     return result.scalars().all()
 
+students_fts = table("students_fts", column("rowid"), column("rank"), column("students_fts"))
+
+def fts_match_expression(search_term: str) -> Optional[str]:
+    # Quote each word so user input cannot inject FTS5 syntax, and match it as a prefix
+    tokens = re.findall(r"\w+", search_term)
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+async def search_students_ranked(db: AsyncSession, search_term: str, after: Optional[dict] = None, limit: int = 20):
+    """Prefix full-text search over name and email, best bm25 rank first.
+
+    Returns (student, rank) pairs; after is the (rank, id) of the last row already returned.
+    """
+    match = fts_match_expression(search_term)
+    if match is None:
+        return []
+    rank = students_fts.c.rank
+    query = (
+        select(models.Student, rank)
+        .join(students_fts, students_fts.c.rowid == models.Student.id)
+        .where(students_fts.c.students_fts.op("MATCH")(match))
+    )
+    if after is not None:
+        query = query.where(or_(rank > after["rank"], and_(rank == after["rank"], models.Student.id > after["id"])))
+    query = query.order_by(rank, models.Student.id).limit(limit)
+    result = await db.execute(query)
+    return [tuple(row) for row in result.all()]
+
 # New CRUD functions
 async def create_course(db: AsyncSession, course: schemas.CourseCreate):
-    db_course = models.Course(**course.dict())
-    db.add(db_course)
+    db_course = (await db.scalars(_insert_course, [course.model_dump()])).one()
+    await db.execute(_insert_course_count, {"course_id": db_course.id})
     await db.commit()
-    await db.refresh(db_course)
+    await cache.response_cache.invalidate(f"course:{db_course.id}", f"course:{db_course.id}:students", namespaces=("course-counts",))
     return db_course
 
 async def get_course(db: AsyncSession, course_id: int):
-    result = await db.execute(select(models.Course).filter(models.Course.id == course_id))
+    result = await db.execute(_course_by_id, {"course_id": course_id})
     return result.scalars().first()
 
+def enrollment_cache_keys(student_id: int, course_id: int):
+    return (f"student:{student_id}:courses:ids", f"student:{student_id}:courses:courses", f"course:{course_id}:students")
+
 async def create_enrollment(db: AsyncSession, enrollment: schemas.EnrollmentCreate):
-    student = await get_student(db, enrollment.student_id)
-    if not student:
-        raise HTTPException(status_code=404, detail="Student not found")
-    course = await get_course(db, enrollment.course_id)
-    if not course:
-        raise HTTPException(status_code=404, detail="Course not found")
-    existing_enrollment = await db.execute(
-        select(models.Enrollment).filter(
-            models.Enrollment.student_id == enrollment.student_id,
-            models.Enrollment.course_id == enrollment.course_id
-        )
-    )
-    if existing_enrollment.scalars().first():
+    params = {"student_id": enrollment.student_id, "course_id": enrollment.course_id}
+    try:
+        db_enrollment = (await db.scalars(_insert_enrollment, params)).one_or_none()
+    except IntegrityError:
+        # ix_enrollments_student_course rejects the duplicate pair
+        await db.rollback()
         raise HTTPException(status_code=400, detail="Already enrolled")
-    db_enrollment = models.Enrollment(**enrollment.dict())
-    db.add(db_enrollment)
+    if db_enrollment is None:
+        await db.rollback()
+        # Only the failure path pays for working out which side was missing
+        if (await db.execute(_student_exists, params)).first() is None:
+            raise HTTPException(status_code=404, detail="Student not found")
+        raise HTTPException(status_code=404, detail="Course not found")
+    await db.execute(_add_to_course_count, {"counted_course_id": enrollment.course_id, "added": 1})
     await db.commit()
-    await db.refresh(db_enrollment)
+    await cache.response_cache.invalidate(*enrollment_cache_keys(enrollment.student_id, enrollment.course_id), namespaces=("course-counts",))
     return db_enrollment
 
+async def bulk_create_enrollments(db: AsyncSession, enrollments: List[schemas.EnrollmentCreate], chunk_size: int = 500):
+    """Validate and insert enrollment pairs set-wise; returns one status per input pair."""
+    statuses = [None] * len(enrollments)
+    seen_pairs = set()
+    for start in range(0, len(enrollments), chunk_size):
+        chunk = list(enumerate(enrollments[start:start + chunk_size], start))
+        pairs = {(e.student_id, e.course_id) for _, e in chunk}
+        queries = (
+            select(models.Student.id).where(models.Student.id.in_({p[0] for p in pairs})),
+            select(models.Course.id).where(models.Course.id.in_({p[1] for p in pairs})),
+            select(models.Enrollment.student_id, models.Enrollment.course_id).where(
+                tuple_(models.Enrollment.student_id, models.Enrollment.course_id).in_(pairs)
+            ),
+        )
+        results = [await db.execute(query) for query in queries]
+        student_ids = set(results[0].scalars().all())
+        course_ids = set(results[1].scalars().all())
+        enrolled = {tuple(row) for row in results[2].all()}
+        rows = []
+        for index, e in chunk:
+            pair = (e.student_id, e.course_id)
+            if e.student_id not in student_ids:
+                statuses[index] = "student_not_found"
+            elif e.course_id not in course_ids:
+                statuses[index] = "course_not_found"
+            elif pair in enrolled:
+                statuses[index] = "already_enrolled"
+            elif pair in seen_pairs:
+                statuses[index] = "duplicate_in_request"
+            else:
+                statuses[index] = "enrolled"
+                seen_pairs.add(pair)
+                rows.append({"student_id": e.student_id, "course_id": e.course_id})
+        if rows:
+            try:
+                await db.execute(insert(models.Enrollment), rows)
+            except IntegrityError:
+                # A concurrent request enrolled one of the pairs after validation
+                await db.rollback()
+                raise EnrollmentConflictError("Enrollment batch conflicted with a concurrent write; retry")
+    added = {}
+    for _, course_id in seen_pairs:
+        added[course_id] = added.get(course_id, 0) + 1
+    if added:
+        await db.execute(_add_to_course_count, [
+            {"counted_course_id": course_id, "added": count} for course_id, count in added.items()
+        ])
+    await db.commit()
+    keys = [key for pair in seen_pairs for key in enrollment_cache_keys(*pair)]
+    await cache.response_cache.invalidate(*keys, namespaces=("course-counts",) if added else ())
+    return statuses
+
+# Outer join from the parent row so a missing parent (no rows) and an empty list (one null row) differ
+_enrolled_course_ids = (
+    select(models.Student.id, models.Enrollment.course_id)
+    .outerjoin(models.Enrollment, models.Enrollment.student_id == models.Student.id)
+    .where(models.Student.id == bindparam("student_id"))
+    .order_by(models.Enrollment.course_id)
+)
+_enrolled_course_details = (
+    select(models.Student.id, models.Course)
+    .outerjoin(models.Enrollment, models.Enrollment.student_id == models.Student.id)
+    .outerjoin(models.Course, models.Course.id == models.Enrollment.course_id)
+    .where(models.Student.id == bindparam("student_id"))
+    .order_by(models.Course.id)
+)
+_course_students = (
+    select(models.Course.id, models.Student)
+    .outerjoin(models.Enrollment, models.Enrollment.course_id == models.Course.id)
+    .outerjoin(models.Student, models.Student.id == models.Enrollment.student_id)
+    .where(models.Course.id == bindparam("course_id"))
+    .order_by(models.Student.id)
+)
+
 async def get_enrolled_courses(db: AsyncSession, student_id: int):
-    student = await get_student(db, student_id)
-    if not student:
+    rows = (await db.execute(_enrolled_course_ids, {"student_id": student_id})).all()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Student not found")
+    return [course_id for _, course_id in rows if course_id is not None]
+
+async def get_enrolled_course_details(db: AsyncSession, student_id: int):
+    rows = (await db.execute(_enrolled_course_details, {"student_id": student_id})).all()
+    if not rows:
         raise HTTPException(status_code=404, detail="Student not found")
-    result = await db.execute(
-        select(models.Enrollment.course_id).filter(models.Enrollment.student_id == student_id)
+    return [course for _, course in rows if course is not None]
+
+async def get_course_students(db: AsyncSession, course_id: int):
+    rows = (await db.execute(_course_students, {"course_id": course_id})).all()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Course not found")
+    return [student for _, student in rows if student is not None]
+
+# Aggregates for /stats. Course totals read the summary table; the rest GROUP BY in SQL.
+_course_counts = (
+    select(models.Course.id, models.Course.title, models.CourseEnrollmentCount.enrollment_count)
+    .join(models.CourseEnrollmentCount, models.CourseEnrollmentCount.course_id == models.Course.id)
+)
+_course_counts_by_id = _course_counts.order_by(models.Course.id).offset(bindparam("skip", type_=Integer)).limit(bindparam("limit", type_=Integer))
+_course_counts_by_popularity = _course_counts.order_by(
+    models.CourseEnrollmentCount.enrollment_count.desc(), models.Course.id
+).limit(bindparam("limit", type_=Integer))
+_course_count = _course_counts.where(models.Course.id == bindparam("course_id"))
+
+async def get_course_enrollment_counts(db: AsyncSession, skip: int = 0, limit: int = 100):
+    result = await db.execute(_course_counts_by_id, {"skip": skip, "limit": limit})
+    return result.all()
+
+async def get_popular_courses(db: AsyncSession, limit: int = 10):
+    result = await db.execute(_course_counts_by_popularity, {"limit": limit})
+    return result.all()
+
+async def get_course_enrollment_count(db: AsyncSession, course_id: int):
+    result = await db.execute(_course_count, {"course_id": course_id})
+    return result.first()
+
+async def get_age_brackets(db: AsyncSession, width: int = 5):
+    """Student counts per age bracket of the given width, youngest first; students without an age are skipped."""
+    bracket = (models.Student.age // width) * width
+    query = (
+        select(bracket.label("min_age"), func.count(models.Student.id))
+        .where(models.Student.age.is_not(None))
+        .group_by(bracket)
+        .order_by(bracket)
     )
-    return result.scalars().all()
\ No newline at end of file
+    result = await db.execute(query)
+    return result.all()
+
+async def recompute_course_enrollment_counts(db: AsyncSession) -> int:
+    """Rebuild course_enrollment_counts from the enrollments table; returns the number of courses counted."""
+    totals = (
+        select(models.Course.id, func.count(models.Enrollment.id))
+        .outerjoin(models.Enrollment, models.Enrollment.course_id == models.Course.id)
+        .group_by(models.Course.id)
+    )
+    await db.execute(delete(_enrollment_counts))
+    result = await db.execute(insert(_enrollment_counts).from_select(["course_id", "enrollment_count"], totals))
+    await db.commit()
+    await cache.response_cache.invalidate(namespaces=("course-counts",))
+    return result.rowcount
+
+# Exports read plain rows (no ORM identity map) off a server-side cursor, one batch at a time
+
+async def stream_student_rows(db: AsyncSession, course_id: Optional[int] = None, batch_size: int = 1000) -> AsyncIterator[list]:
+    query = select(models.Student.id, models.Student.name, models.Student.age, models.Student.email)
+    if course_id is not None:
+        query = query.join(models.Enrollment, models.Enrollment.student_id == models.Student.id).where(
+            models.Enrollment.course_id == course_id
+        )
+    result = await db.stream(query.order_by(models.Student.id).execution_options(yield_per=batch_size))
+    async for rows in result.partitions():
+        yield rows
+
+async def stream_enrollment_rows(db: AsyncSession, course_id: Optional[int] = None, batch_size: int = 1000) -> AsyncIterator[list]:
+    query = select(models.Enrollment.id, models.Enrollment.student_id, models.Enrollment.course_id)
+    if course_id is not None:
+        query = query.where(models.Enrollment.course_id == course_id)
+    result = await db.stream(query.order_by(models.Enrollment.id).execution_options(yield_per=batch_size))
+    async for rows in result.partitions():
+        yield rows
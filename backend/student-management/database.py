@@ -1,66 +1,186 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy import create_engine
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import declarative_base
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+import itertools
 import os
+import time
+
+from config import settings
+
+# Sync driver to use when SYNC_DATABASE_URL is not set explicitly
+_SYNC_DRIVERS = {
+    "sqlite+aiosqlite": "sqlite",
+    "postgresql+asyncpg": "postgresql+psycopg2",
+}
+
+def sync_url_for(async_url: str) -> str:
+    scheme, sep, rest = async_url.partition("://")
+    return _SYNC_DRIVERS.get(scheme, scheme) + sep + rest
 
 # Database URLs
-ASYNC_SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./students.db"
-SYNC_SQLALCHEMY_DATABASE_URL = "sqlite:///./students.db"
-TEST_SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
-
-# Engines
-async_engine = create_async_engine(
-    ASYNC_SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False}
-)
-
-sync_engine = create_engine(
-    SYNC_SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False}
-)
-
-test_engine = create_engine(
-    TEST_SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    poolclass=StaticPool
-)
-
-# Session makers
-AsyncSessionLocal = sessionmaker(
-    bind=async_engine,
-    class_=AsyncSession,
-    expire_on_commit=False
-)
-
-SyncSessionLocal = sessionmaker(
-    bind=sync_engine,
-    autocommit=False,
-    autoflush=False
-)
-
-TestSessionLocal = sessionmaker(
-    bind=test_engine,
-    autocommit=False,
-    autoflush=False
-)
+ASYNC_SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
+SYNC_SQLALCHEMY_DATABASE_URL = settings.SYNC_DATABASE_URL or sync_url_for(settings.DATABASE_URL)
+REPLICA_SQLALCHEMY_DATABASE_URLS = [url.strip() for url in settings.DATABASE_REPLICA_URLS.split(",") if url.strip()]
+
+# Pool checkout wait, keyed by engine name
+pool_stats = {}
+
+class _CheckoutTimingMixin:
+    """Records how long callers wait to check a connection out of the pool."""
+
+    engine_name = "default"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            stats = pool_stats.setdefault(self.engine_name, {"checkouts": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0})
+            stats["checkouts"] += 1
+            stats["wait_seconds"] += waited
+            stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+
+class TimedQueuePool(_CheckoutTimingMixin, QueuePool):
+    pass
+
+class TimedAsyncAdaptedQueuePool(_CheckoutTimingMixin, AsyncAdaptedQueuePool):
+    pass
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+    cursor.execute(f"PRAGMA cache_size={int(settings.SQLITE_CACHE_SIZE)}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.close()
+
+def build_engine(url: str, name: str, is_async: bool = False):
+    """Create an engine with pool sizing from settings and SQLite pragmas applied on connect."""
+    pool_class = TimedAsyncAdaptedQueuePool if is_async else TimedQueuePool
+    pool_class = type(f"{pool_class.__name__}_{name}", (pool_class,), {"engine_name": name})
+    kwargs = dict(
+        poolclass=pool_class,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+    if url.startswith("sqlite"):
+        kwargs["connect_args"] = {"check_same_thread": False}
+    engine = (create_async_engine if is_async else create_engine)(url, **kwargs)
+    if url.startswith("sqlite"):
+        event.listen(engine.sync_engine if is_async else engine, "connect", _apply_sqlite_pragmas)
+    return engine
+
+_engines = {}
+_engine_hooks = []
+
+def on_engine_created(hook):
+    """Call hook(name, engine) for every engine, including ones created later."""
+    _engine_hooks.append(hook)
+    for name, engine in list(_engines.items()):
+        hook(name, engine)
+
+def _engine(name: str, url: str):
+    # Engines are built on first use, so importing the app opens no pools and workers
+    # only pay for the engines their traffic touches.
+    engine = _engines.get(name)
+    if engine is None:
+        engine = _engines[name] = build_engine(url, name, is_async=True)
+        for hook in _engine_hooks:
+            hook(name, engine)
+    return engine
+
+def get_async_engine():
+    return _engine("async", ASYNC_SQLALCHEMY_DATABASE_URL)
+
+def get_replica_engines():
+    return [_engine(f"replica{i}", url) for i, url in enumerate(REPLICA_SQLALCHEMY_DATABASE_URLS)]
+
+def all_engines():
+    """(name, engine) for every engine created so far."""
+    return list(_engines.items())
+
+def get_pool_stats() -> dict:
+    report = {}
+    for name, engine in all_engines():
+        pool = engine.pool
+        report[name] = {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            **pool_stats.get(name, {"checkouts": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}),
+        }
+    return report
+
+async def dispose_engines():
+    for engine in list(_engines.values()):
+        await engine.dispose()
+
+# Session makers, bound to their engine when first used
+_session_factory = None
+_replica_cycle = None
+
+def primary_sessions():
+    """Session factory bound to the primary, for work outside a request such as background jobs."""
+    global _session_factory
+    if _session_factory is None:
+        _session_factory = async_sessionmaker(bind=get_async_engine(), class_=AsyncSession, expire_on_commit=False)
+    return _session_factory
+
+def _read_sessions():
+    global _replica_cycle
+    if _replica_cycle is None:
+        factories = [
+            async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+            for engine in get_replica_engines()
+        ]
+        _replica_cycle = itertools.cycle(factories or [primary_sessions()])
+    return next(_replica_cycle)
 
 Base = declarative_base()
 
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+_migration_head = None
+
+def migration_head() -> str:
+    """Newest Alembic revision shipped with the code, read from the migration scripts once."""
+    global _migration_head
+    if _migration_head is None:
+        # Imported here so serving requests never pays for loading Alembic until /ready is asked
+        from alembic.config import Config
+        from alembic.script import ScriptDirectory
+        config = Config(os.path.join(APP_DIR, "alembic.ini"))
+        config.set_main_option("script_location", os.path.join(APP_DIR, "alembic"))
+        _migration_head = ScriptDirectory.from_config(config).get_current_head()
+    return _migration_head
+
+async def schema_revision(session: AsyncSession):
+    """Revision recorded by `alembic upgrade`, or None if the database was never migrated."""
+    tables = await session.run_sync(lambda sync_session: inspect(sync_session.connection()).get_table_names())
+    if "alembic_version" not in tables:
+        return None
+    return await session.scalar(text("SELECT version_num FROM alembic_version"))
+
 async def get_db():
-    async with AsyncSessionLocal() as session:
+    async with primary_sessions()() as session:
         yield session
 
-def get_sync_db():
-    db = SyncSessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-def get_test_db():
-    db = TestSessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
\ No newline at end of file
+async def get_read_db():
+    """Session for read-only handlers: round-robins over replicas, or the primary if none are configured."""
+    async with _read_sessions()() as session:
+        yield session
+
+async def get_cache_fill_db():
+    """Session for handlers whose loads fill the response cache: always the primary.
+
+    A write bumps the cache generation as soon as it commits. A replica that has not
+    replayed it yet would have its stale rows cached under the new generation and served
+    (and revalidated with 304) until the TTL, not just for the replication lag. Only cache
+    misses reach the primary.
+    """
+    async with primary_sessions()() as session:
+        yield session
@@ -0,0 +1,85 @@
+# export.py
+import csv
+import io
+import zlib
+from typing import AsyncIterator, Sequence, Tuple
+
+import compression
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pyarrow is only needed for format=parquet
+    pyarrow = None
+
+# (column, Arrow type) in the order the crud export queries select them
+STUDENT_COLUMNS = (("id", "int64"), ("name", "string"), ("age", "int64"), ("email", "string"))
+ENROLLMENT_COLUMNS = (("id", "int64"), ("student_id", "int64"), ("course_id", "int64"))
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+async def csv_chunks(columns: Sequence[Tuple[str, str]], batches: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    """Render each row batch as one CSV chunk, header first."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in columns])
+    async for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Header only: nothing matched
+        yield buffer.getvalue().encode()
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back whatever was written since the last drain."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+async def parquet_chunks(columns: Sequence[Tuple[str, str]], batches: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    """Write each row batch as a Parquet row group and stream the file as it grows; the footer comes last."""
+    if pyarrow is None:
+        raise RuntimeError("Parquet export requires the 'pyarrow' package")
+    schema = pyarrow.schema([(name, pyarrow.type_for_alias(type_)) for name, type_ in columns])
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    async for rows in batches:
+        arrays = [pyarrow.array([row[i] for row in rows], field.type) for i, field in enumerate(schema)]
+        writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+async def gzip_chunks(chunks: AsyncIterator[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    """Gzip a byte stream on the fly; every input chunk is flushed so the client sees steady progress."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 writes a gzip header and trailer
+    async for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    return compression.quality(compression.accepted(accept_encoding), "gzip") > 0
@@ -0,0 +1,298 @@
+# jobs.py
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Optional
+
+from sqlalchemy import func, insert, or_, and_, select, update
+
+import metrics
+import models
+from config import settings
+from database import primary_sessions
+
+logger = logging.getLogger("jobs")
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+class JobQueueFullError(Exception):
+    pass
+
+class PermanentJobError(Exception):
+    """Raised by a handler for failures that retrying cannot fix."""
+
+_handlers = {}
+
+def handler(kind: str):
+    """Register `async def f(db, payload) -> dict` as the runner for jobs of this kind."""
+    def register(func):
+        _handlers[kind] = func
+        return func
+    return register
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    payload: dict
+    owner: Optional[str] = None
+    status: str = QUEUED
+    attempts: int = 0
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    run_after: float = 0.0
+    locked_until: Optional[float] = None
+    created_at: float = 0.0
+    updated_at: float = 0.0
+
+class MemoryJobStore:
+    """Jobs in process memory: lost on restart. Only the newest max_finished finished jobs are kept."""
+
+    def __init__(self, max_finished: int = 10000):
+        self._jobs = {}
+        self._due = []  # heap of (run_after, seq, job id)
+        self._seq = itertools.count()
+        self._finished = OrderedDict()
+        self.max_finished = max_finished
+
+    async def add(self, db, job: Job):
+        self._jobs[job.id] = job
+        heapq.heappush(self._due, (job.run_after, next(self._seq), job.id))
+
+    async def queued(self, db) -> int:
+        return len(self._due)
+
+    async def claim(self, db, now: float, lease_seconds: float) -> Optional[Job]:
+        if not self._due or self._due[0][0] > now:
+            return None
+        job = self._jobs[heapq.heappop(self._due)[2]]
+        job.status, job.attempts, job.locked_until, job.updated_at = RUNNING, job.attempts + 1, now + lease_seconds, now
+        return job
+
+    async def save(self, db, job: Job):
+        self._jobs[job.id] = job
+        if job.status == QUEUED:
+            heapq.heappush(self._due, (job.run_after, next(self._seq), job.id))
+        elif job.status in (SUCCEEDED, FAILED):
+            self._finished[job.id] = None
+            if len(self._finished) > self.max_finished:
+                self._jobs.pop(self._finished.popitem(last=False)[0], None)
+
+    async def get(self, db, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+jobs_table = models.Job.__table__
+
+def _job_from_row(row) -> Job:
+    values = dict(row._mapping)
+    values["payload"] = json.loads(values["payload"])
+    values["result"] = json.loads(values["result"]) if values["result"] is not None else None
+    return Job(**values)
+
+class DatabaseJobStore:
+    """Jobs in the `jobs` table, so they survive restarts and any worker process can run them.
+
+    Claiming a job leases it until locked_until; a job left running by a process that died is
+    claimed again once its lease runs out.
+    """
+
+    async def add(self, db, job: Job):
+        values = {**job.__dict__, "payload": json.dumps(job.payload), "result": None}
+        await db.execute(insert(jobs_table).values(values))
+        await db.commit()
+
+    async def queued(self, db) -> int:
+        return await db.scalar(select(func.count()).select_from(jobs_table).where(jobs_table.c.status == QUEUED))
+
+    async def claim(self, db, now: float, lease_seconds: float) -> Optional[Job]:
+        c = jobs_table.c
+        due = or_(and_(c.status == QUEUED, c.run_after <= now), and_(c.status == RUNNING, c.locked_until < now))
+        candidate = select(c.id).where(due).order_by(c.run_after).limit(1).scalar_subquery()
+        # `due` is checked again so a concurrent claimer that got there first makes this a no-op
+        stmt = (
+            update(jobs_table).where(c.id == candidate, due)
+            .values(status=RUNNING, attempts=c.attempts + 1, locked_until=now + lease_seconds, updated_at=now)
+            .returning(*jobs_table.c)
+        )
+        row = (await db.execute(stmt)).first()
+        await db.commit()
+        return _job_from_row(row) if row is not None else None
+
+    async def save(self, db, job: Job):
+        await db.execute(update(jobs_table).where(jobs_table.c.id == job.id).values(
+            status=job.status, attempts=job.attempts, error=job.error, run_after=job.run_after,
+            locked_until=job.locked_until, updated_at=job.updated_at,
+            result=json.dumps(job.result) if job.result is not None else None,
+        ))
+        await db.commit()
+
+    async def get(self, db, job_id: str) -> Optional[Job]:
+        row = (await db.execute(select(jobs_table).where(jobs_table.c.id == job_id))).first()
+        return _job_from_row(row) if row is not None else None
+
+class JobQueue:
+    """Runs jobs on `workers` asyncio tasks in this process, retrying failures with exponential backoff."""
+
+    def __init__(self, store, workers: int, max_attempts: int, retry_backoff: float, poll_seconds: float,
+                 lease_seconds: float, max_queued: int):
+        self.store = store
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.max_queued = max_queued
+        self.session_factory = None  # defaults to the primary database
+        self._tasks = []
+        self._loop = None
+        self._wake = None
+        self._stopping = False
+        self._metrics = {"submitted": 0, "running": 0, "succeeded": 0, "retried": 0, "failed": 0}
+
+    def _session(self):
+        return (self.session_factory or primary_sessions())()
+
+    def start(self):
+        """Start the worker tasks on the running loop; a no-op if they are already running there."""
+        loop = asyncio.get_running_loop()
+        if self._tasks and self._loop is loop:
+            # _work does not let errors out, but a worker that died anyway is replaced here
+            for i, task in enumerate(self._tasks):
+                if task.done():
+                    if not task.cancelled() and task.exception() is not None:
+                        logger.error("job worker died; restarting it", exc_info=task.exception())
+                    self._tasks[i] = loop.create_task(self._work(), name=task.get_name())
+            return
+        self._loop, self._wake, self._stopping = loop, asyncio.Event(), False
+        self._tasks = [loop.create_task(self._work(), name=f"job-worker-{i}") for i in range(self.workers)]
+
+    async def shutdown(self, timeout: float):
+        """Let running jobs finish for up to `timeout` seconds, then cancel the workers."""
+        if not self._tasks:
+            return
+        self._stopping = True
+        self._wake.set()
+        _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        self._tasks = []
+
+    async def submit(self, kind: str, payload: dict, owner: Optional[str] = None) -> Job:
+        if kind not in _handlers:
+            raise KeyError(f"No handler registered for job kind {kind!r}")
+        now = time.time()
+        job = Job(id=uuid.uuid4().hex, kind=kind, payload=payload, owner=owner, run_after=now, created_at=now, updated_at=now)
+        async with self._session() as db:
+            if await self.store.queued(db) >= self.max_queued:
+                raise JobQueueFullError("Job queue is full")
+            await self.store.add(db, job)
+        self._metrics["submitted"] += 1
+        self.start()
+        self._wake.set()
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        async with self._session() as db:
+            return await self.store.get(db, job_id)
+
+    async def _work(self):
+        while not self._stopping:
+            try:
+                async with self._session() as db:
+                    job = await self.store.claim(db, time.time(), self.lease_seconds)
+            except Exception:
+                logger.exception("could not claim a job")
+                job = None
+            if job is not None:
+                try:
+                    await self._run(job)
+                except Exception:
+                    # The job stays running; the database store hands it out again once its lease runs out
+                    logger.exception("job worker error", extra={"fields": {"job_id": job.id, "kind": job.kind}})
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def _run(self, job: Job):
+        # The outcome is built on a copy and only replaces the stored job once it is saved, so
+        # readers never see a result that might not be kept
+        outcome = replace(job)
+        func = _handlers.get(job.kind)
+        self._metrics["running"] += 1
+        started = time.perf_counter()
+        try:
+            if func is None:
+                raise PermanentJobError(f"No handler registered for job kind {job.kind!r}")
+            async with self._session() as db:
+                outcome.result = await func(db, job.payload)
+            outcome.status, outcome.error = SUCCEEDED, None
+        except Exception as e:
+            outcome.error = f"{type(e).__name__}: {e}"
+            if isinstance(e, PermanentJobError) or job.attempts >= self.max_attempts:
+                outcome.status = FAILED
+                logger.warning("job failed", extra={"fields": {"job_id": job.id, "kind": job.kind, "attempts": job.attempts, "error": outcome.error}})
+            else:
+                outcome.status = QUEUED
+                outcome.run_after = time.time() + self.retry_backoff * 2 ** (job.attempts - 1)
+                self._metrics["retried"] += 1
+        finally:
+            self._metrics["running"] -= 1
+        metrics.JOB_DURATION.observe(time.perf_counter() - started, job.kind)
+        metrics.JOBS.inc(job.kind, "retried" if outcome.status == QUEUED else outcome.status)
+        if outcome.status != QUEUED:
+            self._metrics[outcome.status] += 1
+        outcome.locked_until, outcome.updated_at = None, time.time()
+        await self._save(outcome)
+
+    async def _save(self, job: Job):
+        """Save a job's outcome, retrying the save rather than the handler, which may not be idempotent.
+
+        An outcome that still cannot be saved (e.g. a result that is not JSON) is stored as a
+        failure without its result.
+        """
+        for attempt in range(self.max_attempts):
+            if attempt:
+                await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            try:
+                async with self._session() as db:
+                    await self.store.save(db, job)
+                return
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                logger.warning("could not save a job's outcome", extra={"fields": {"job_id": job.id, "kind": job.kind, "attempt": attempt + 1, "error": error}})
+        failed = replace(job, status=FAILED, result=None, error=f"Could not save the job's outcome: {error}")
+        async with self._session() as db:
+            await self.store.save(db, failed)
+
+    def stats(self) -> dict:
+        return {
+            "store": settings.JOB_STORE,
+            "workers": self.workers,
+            "max_attempts": self.max_attempts,
+            "max_queued": self.max_queued,
+            **self._metrics,
+        }
+
+def _build_store():
+    if settings.JOB_STORE == "database":
+        return DatabaseJobStore()
+    return MemoryJobStore()
+
+queue = JobQueue(
+    _build_store(),
+    workers=settings.JOB_WORKERS,
+    max_attempts=settings.JOB_MAX_ATTEMPTS,
+    retry_backoff=settings.JOB_RETRY_BACKOFF_SECONDS,
+    poll_seconds=settings.JOB_POLL_SECONDS,
+    lease_seconds=settings.JOB_LEASE_SECONDS,
+    max_queued=settings.JOB_MAX_QUEUED,
+)
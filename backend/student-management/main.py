@@ -1,29 +1,66 @@
 # main.py
+import csv
+import io
+import json
 import logging
-from datetime import datetime, timedelta
-from typing import Annotated
+import math
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Annotated, Literal
 
-from fastapi import FastAPI, Depends, HTTPException, status, Request
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-from pydantic import BaseModel
+import orjson
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 # Local imports
-from database import async_engine as engine, Base, get_db
+from database import get_db, get_read_db, get_cache_fill_db, get_pool_stats, on_engine_created, dispose_engines, migration_head, schema_revision
 import models
 import crud
+import cache
+import compression
+import passwords
+import profiling
+import metrics
+import export
+import jobs
+import ratelimit
+import tokens
 import schemas
-from logging_config import setup_logging
-from config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from pagination import encode_cursor, decode_cursor, encode_search_cursor, decode_search_cursor, InvalidCursorError
+from logging_config import setup_logging, should_sample
+from config import settings, BULK_INSERT_CHUNK_SIZE, EXPORT_BATCH_SIZE, EXPORT_GZIP_LEVEL
 
 logger = logging.getLogger(__name__)
 setup_logging()
 
 app = FastAPI(title="Student Management API", version="1.0.0")
 
+on_engine_created(lambda name, engine: metrics.instrument_engine(engine, name))
+on_engine_created(lambda name, engine: profiling.instrument_engine(engine, name))
+
+def _pool_metrics():
+    yield "# HELP db_pool_checked_out Connections currently checked out of the pool."
+    yield "# TYPE db_pool_checked_out gauge"
+    pool_stats = get_pool_stats()
+    for name, stats in pool_stats.items():
+        yield f'db_pool_checked_out{{engine="{name}"}} {stats["checked_out"]}'
+    yield "# HELP db_pool_checkouts_total Pool checkouts."
+    yield "# TYPE db_pool_checkouts_total counter"
+    for name, stats in pool_stats.items():
+        yield f'db_pool_checkouts_total{{engine="{name}"}} {stats["checkouts"]}'
+    yield "# HELP db_pool_checkout_wait_seconds_total Time spent waiting for pool checkouts."
+    yield "# TYPE db_pool_checkout_wait_seconds_total counter"
+    for name, stats in pool_stats.items():
+        yield f'db_pool_checkout_wait_seconds_total{{engine="{name}"}} {stats["wait_seconds"]}'
+
+metrics.register_collector(_pool_metrics)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -32,65 +69,293 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# The schema is owned by Alembic (`alembic upgrade head`); startup only starts the job workers
 @app.on_event("startup")
 async def startup():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    jobs.queue.start()
+    tokens.revocations.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await jobs.queue.shutdown(settings.GRACEFUL_SHUTDOWN_SECONDS)
+    tokens.revocations.shutdown()
+    passwords.shutdown()
+    await dispose_engines()
 
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: str
+    expires_in: int
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class RevokeRequest(BaseModel):
+    refresh_token: str | None = None
 
 class TokenData(BaseModel):
     username: str | None = None
 
 async def authenticate_user(db: AsyncSession, username: str, password: str):
     user = await crud.get_user_by_username(db, username)
-    if not user or not pwd_context.verify(password, user.hashed_password):
+    if not user or not await passwords.verify_password(password, user.hashed_password):
         return False
     return user
 
-def create_access_token(data: dict, expires_delta: timedelta | None = None):
-    to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=15))
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+def _token_response(user) -> dict:
+    access_token, expires_in = tokens.issue_access_token(user)
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": tokens.issue_refresh_token(user), "expires_in": expires_in}
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: AsyncSession = Depends(get_db)):
+async def _load_user(db: AsyncSession, token_data: TokenData) -> schemas.User | None:
+    user = cache.user_cache.get(token_data.username)
+    if user is None:
+        db_user = await crud.get_user_by_username(db, username=token_data.username)
+        if db_user is None:
+            return None
+        user = schemas.User.model_validate(db_user, from_attributes=True)
+        cache.user_cache.set(user.username, user)
+    return user
+
+async def get_current_principal(request: Request, token: Annotated[str, Depends(oauth2_scheme)], db: AsyncSession = Depends(get_db)) -> tokens.Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
-    except JWTError:
+    principal = cache.token_cache.get(token)
+    if principal is None:
+        # Admission control may already have verified this token for its rate-limit key
+        checked = getattr(request.state, "bearer_claims", None)
+        if checked is not None and checked[0] == token:
+            claims = checked[1]
+        else:
+            try:
+                claims = tokens.decode(token)
+            except tokens.InvalidTokenError:
+                raise credentials_exception
+        if "uid" in claims:
+            # Everything needed is in the signed claims, so the users table is not read
+            user = schemas.User(id=claims["uid"], username=claims["sub"], is_active=claims["act"])
+        else:
+            # Issued before tokens carried uid/act/ver: look the user up, and treat it as version 0
+            user = await _load_user(db, TokenData(username=claims["sub"]))
+            if user is None:
+                raise credentials_exception
+        principal = tokens.Principal(user, claims.get("jti"), claims.get("exp"), claims.get("ver", 0))
+        cache.token_cache.set(token, principal, expires_at=claims.get("exp"))
+    if not principal.user.is_active or tokens.revocations.is_revoked(principal.jti, principal.user.id, principal.version):
         raise credentials_exception
-    user = await crud.get_user_by_username(db, username=token_data.username)
-    if user is None:
-        raise credentials_exception
-    return user
+    return principal
 
+async def get_current_user(principal: tokens.Principal = Depends(get_current_principal)) -> schemas.User:
+    return principal.user
+
+def _client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+def _bearer_subject(request: Request) -> str | None:
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    # peek, so the authentication that follows is the only lookup counted in the cache stats
+    principal = cache.token_cache.peek(token)
+    if principal is not None:
+        return principal.username
+    try:
+        claims = tokens.decode(token)
+    except tokens.InvalidTokenError:
+        return None
+    request.state.bearer_claims = (token, claims)
+    return claims["sub"]
+
+def _shed(reason: str, status_code: int, detail: str, retry_after: float) -> Response:
+    metrics.HTTP_SHED.inc(reason)
+    return JSONResponse({"detail": detail}, status_code=status_code, headers={"Retry-After": ratelimit.retry_after_header(retry_after)})
+
+# Registered first so it runs innermost, on the body exactly as the endpoint produced it.
+# Streamed responses (no Content-Length) are left alone; exports compress their own chunks.
 @app.middleware("http")
-async def log_requests(request: Request, call_next):
-    logger.info(f"Request: {request.method} {request.url}")
+async def compress_responses(request: Request, call_next):
+    response = await call_next(request)
+    headers = response.headers
+    length = headers.get("content-length")
+    if (not settings.COMPRESSION_ENABLED or length is None or int(length) < settings.COMPRESSION_MIN_BYTES
+            or "content-encoding" in headers or not compression.compressible(headers.get("content-type", ""))):
+        return response
+    headers.add_vary_header("Accept-Encoding")
+    encoding = compression.choose_encoding(request.headers.get("accept-encoding", ""))
+    if encoding is None:
+        return response
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    compressed = await compression.compress(body, encoding)
+
+    async def single_chunk():
+        yield compressed
+
+    headers["Content-Encoding"] = encoding
+    headers["Content-Length"] = str(len(compressed))
+    # The compressed bytes differ from the identity body, so a strong validator becomes weak
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        headers["ETag"] = "W/" + etag
+    response.body_iterator = single_chunk()
+    return response
+
+# Registered before instrument_requests so it runs inside it and refusals still show up in metrics
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    path = request.url.path
+    if settings.RATE_LIMIT_ENABLED and request.method == "POST":
+        if path in ratelimit.LOGIN_PATHS:
+            key, rule = f"ip:{_client_ip(request)}:login", ratelimit.LOGIN_RULE
+        else:
+            subject = _bearer_subject(request)
+            key = f"user:{subject}:write" if subject else f"ip:{_client_ip(request)}:write"
+            rule = ratelimit.WRITE_RULE
+        retry_after = await ratelimit.buckets.take(key, rule)
+        if retry_after:
+            return _shed("rate_limit", status.HTTP_429_TOO_MANY_REQUESTS, "Too many requests", retry_after)
+    if path not in ratelimit.EXPENSIVE_PATHS:
+        return await call_next(request)
+    if not ratelimit.gate.try_enter():
+        return _shed("overload", status.HTTP_503_SERVICE_UNAVAILABLE, "Server is busy, retry shortly", 1)
     try:
         response = await call_next(request)
-        logger.info(f"Response: {response.status_code}")
-        return response
-    except Exception as e:
-        logger.exception(f"Exception: {str(e)}")
+    except Exception:
+        ratelimit.gate.leave()
         raise
+    # Hold the slot until the body is sent, which matters for streamed exports
+    body = response.body_iterator
+
+    async def release_after_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            ratelimit.gate.leave()
+
+    response.body_iterator = release_after_body()
+    return response
+
+@app.middleware("http")
+async def profile_queries(request: Request, call_next):
+    if not profiling.enabled:
+        return await call_next(request)
+    profile = profiling.begin(request.method, request.url.path)
+    response = await call_next(request)
+    # Queries run while a streamed body is sent come after the headers, so they are not counted
+    profiling.finish(profile, _route_template(request))
+    response.headers["Server-Timing"] = profile.server_timing()
+    return response
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    start = time.perf_counter()
+    metrics.HTTP_IN_FLIGHT.inc()
+    try:
+        response = await call_next(request)
+    except Exception:
+        duration_ms = (time.perf_counter() - start) * 1000
+        _record_request_metrics(request, 500, duration_ms)
+        logger.exception("request failed", extra={"fields": _request_fields(request, 500, duration_ms)})
+        raise
+    finally:
+        metrics.HTTP_IN_FLIGHT.dec()
+    duration_ms = (time.perf_counter() - start) * 1000
+    _record_request_metrics(request, response.status_code, duration_ms)
+    if response.status_code >= 500 or duration_ms >= settings.LOG_SLOW_REQUEST_MS or should_sample():
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("request", extra={"fields": _request_fields(request, response.status_code, duration_ms)})
+    return response
+
+def _route_template(request: Request) -> str | None:
+    route = request.scope.get("route")
+    return getattr(route, "path", None)
+
+def _record_request_metrics(request: Request, status_code: int, duration_ms: float):
+    # Unmatched paths share one label so arbitrary URLs cannot blow up series cardinality
+    route = _route_template(request) or "<unmatched>"
+    metrics.HTTP_REQUESTS.inc(request.method, route, str(status_code))
+    metrics.HTTP_LATENCY.observe(duration_ms / 1000, request.method, route)
+
+def _request_fields(request: Request, status_code: int, duration_ms: float) -> dict:
+    # Log the route template rather than the raw URL, so records group by endpoint
+    return {
+        "method": request.method,
+        "route": _route_template(request) or request.url.path,
+        "status": status_code,
+        "duration_ms": round(duration_ms, 2),
+    }
+
+def _rows_body(rows) -> bytes:
+    """Serialize column rows (already in response-schema field order) without building models."""
+    return orjson.dumps([row._asdict() for row in rows])
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag.removeprefix("W/") in candidates
+
+def cached_json_response(request: Request, entry: cache.CachedResponse) -> Response:
+    headers = {**entry.headers, "ETag": entry.etag}
+    if _etag_matches(request, entry.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+def _not_modified(request: Request, validators: cache.Validators) -> bool:
+    # If-Modified-Since is only consulted when there is no If-None-Match (RFC 9110 13.2.2)
+    if request.headers.get("if-none-match"):
+        return _etag_matches(request, validators.etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if not if_modified_since:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+    # Only a change strictly before the given second is known not to be newer than the client's copy
+    return validators.last_modified < since
+
+def _last_modified_header(last_modified: float) -> str | None:
+    """Last-Modified rounded up to the whole second, once that second is over.
+
+    While it is still running, a later write could fall in the same second and a client
+    revalidating with that date would get a 304 for stale data, so none is sent yet.
+    """
+    rounded = math.floor(last_modified) + 1
+    return formatdate(rounded, usegmt=True) if time.time() >= rounded else None
+
+async def conditional_list_response(request: Request, namespace: str, key_parts: tuple, load) -> Response:
+    """A list page validated by its namespace's change counter.
+
+    The ETag and Last-Modified come from the counter alone, so a revalidation that
+    matches is answered 304 before any query runs or any body is built.
+    """
+    validators = await cache.response_cache.validators(namespace)
+    headers = {"ETag": validators.etag, "Cache-Control": "private, no-cache"}
+    last_modified = _last_modified_header(validators.last_modified)
+    if last_modified is not None:
+        headers["Last-Modified"] = last_modified
+    if _not_modified(request, validators):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    key = cache.response_cache.page_key(namespace, validators.generation, *key_parts)
+    entry = await cache.response_cache.get_or_load(key, load)
+    return Response(content=entry.body, media_type="application/json", headers={**entry.headers, **headers})
 
 @app.post("/token", response_model=Token)
 async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: AsyncSession = Depends(get_db)):
+    # Per-username bucket, so guessing one account's password from many IPs is limited too
+    if settings.RATE_LIMIT_ENABLED:
+        retry_after = await ratelimit.buckets.take(f"login:{form_data.username}", ratelimit.LOGIN_RULE)
+        if retry_after:
+            metrics.HTTP_SHED.inc("rate_limit")
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many login attempts",
+                                headers={"Retry-After": ratelimit.retry_after_header(retry_after)})
     user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
@@ -98,9 +363,51 @@ async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(data={"sub": user.username}, expires_delta=access_token_expires)
-    return {"access_token": access_token, "token_type": "bearer"}
+    return _token_response(user)
+
+@app.post("/token/refresh", response_model=Token)
+async def refresh_access_token(body: RefreshRequest, db: AsyncSession = Depends(get_db)):
+    invalid = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token", headers={"WWW-Authenticate": "Bearer"})
+    try:
+        claims = tokens.decode(body.refresh_token, typ=tokens.REFRESH)
+    except tokens.InvalidTokenError:
+        raise invalid
+    # Unlike access tokens, refreshes check the users table: they are rare and re-derive is_active/version
+    user = await crud.get_user_by_username(db, claims["sub"])
+    if user is None or not user.is_active or user.id != claims["uid"] or claims["ver"] < user.token_version:
+        raise invalid
+    # Refresh tokens rotate and work once. Seeing one again means it leaked, so end all of the user's sessions.
+    user_id, username = user.id, user.username  # the rollback on a reused token expires `user`
+    if not await crud.revoke_token(db, claims["jti"], claims["exp"]):
+        tokens.revocations.revoke_versions_below(user_id, await crud.bump_token_version(db, user_id))
+        cache.invalidate_user(username)
+        raise invalid
+    tokens.revocations.revoke_jti(claims["jti"], claims["exp"])
+    return _token_response(user)
+
+@app.post("/token/revoke", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_tokens(body: RevokeRequest | None = None, everywhere: bool = False, principal: tokens.Principal = Depends(get_current_principal), db: AsyncSession = Depends(get_db)):
+    """Log out: revoke this access token and the given refresh token, or with ?everywhere=true every token of the user."""
+    user_id = principal.user.id
+    if everywhere:
+        tokens.revocations.revoke_versions_below(user_id, await crud.bump_token_version(db, user_id))
+    elif principal.jti is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="This token can only be revoked with everywhere=true")
+    else:
+        revoke = [(principal.jti, principal.expires_at)]
+        if body is not None and body.refresh_token:
+            try:
+                claims = tokens.decode(body.refresh_token, typ=tokens.REFRESH)
+            except tokens.InvalidTokenError:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid refresh token")
+            if claims["uid"] != user_id:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Refresh token belongs to another user")
+            revoke.append((claims["jti"], claims["exp"]))
+        for jti, expires_at in revoke:
+            await crud.revoke_token(db, jti, expires_at)
+            tokens.revocations.revoke_jti(jti, expires_at)
+    cache.invalidate_user(principal.username)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 @app.post("/students/", response_model=schemas.Student, status_code=status.HTTP_201_CREATED)
 async def create_student(student: schemas.StudentCreate, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
@@ -109,46 +416,324 @@ async def create_student(student: schemas.StudentCreate, db: AsyncSession = Depe
     except crud.DuplicateEmailError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
+def _parse_bulk_rows(body: bytes, content_type: str):
+    if content_type.startswith("text/csv"):
+        return list(csv.DictReader(io.StringIO(body.decode("utf-8-sig"))))
+    rows = json.loads(body)
+    if not isinstance(rows, list):
+        raise ValueError("Expected a JSON array of students")
+    return rows
+
+def _bulk_result(created, rejected) -> dict:
+    rejected.sort(key=lambda r: r["row"])
+    return {"created": [{"row": row, "id": id_} for row, id_ in created], "rejected": rejected}
+
+# A conflicting concurrent write (StudentImportConflictError) is retried by the job queue
+@jobs.handler("students.bulk_import")
+async def _bulk_import_job(db: AsyncSession, payload: dict) -> dict:
+    students = [(row, schemas.StudentCreate.model_validate(data)) for row, data in payload["students"]]
+    created, duplicates = await crud.bulk_create_students(db, students, chunk_size=payload["chunk_size"])
+    rejected = payload["rejected"] + [{"row": row, "error": error} for row, error in duplicates]
+    return _bulk_result(created, rejected)
+
+async def _submit_job(kind: str, payload: dict, current_user: schemas.User) -> Response:
+    """Queue a job and answer 202 Accepted; the client polls the Location for the result."""
+    try:
+        job = await jobs.queue.submit(kind, payload, owner=current_user.username)
+    except jobs.JobQueueFullError as e:
+        return _shed("job_queue_full", status.HTTP_503_SERVICE_UNAVAILABLE, str(e), settings.JOB_POLL_SECONDS)
+    body = schemas.Job.model_validate(job).model_dump(mode="json")
+    return JSONResponse(body, status_code=status.HTTP_202_ACCEPTED, headers={"Location": f"/jobs/{job.id}"})
+
+@app.post("/students/bulk", response_model=schemas.StudentBulkResult, responses={202: {"model": schemas.Job}})
+async def bulk_create_students(request: Request, chunk_size: int = BULK_INSERT_CHUNK_SIZE, background: bool = False, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    if chunk_size < 1:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="chunk_size must be positive")
+    try:
+        rows = _parse_bulk_rows(await request.body(), request.headers.get("content-type", ""))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Could not parse upload: {e}")
+    students, rejected = [], []
+    for row, data in enumerate(rows):
+        try:
+            students.append((row, schemas.StudentCreate.model_validate(data)))
+        except ValidationError as e:
+            error = e.errors()[0]
+            field = ".".join(str(part) for part in error["loc"])
+            rejected.append({"row": row, "error": f"{field}: {error['msg']}" if field else error["msg"]})
+    if background:
+        payload = {"students": [(row, student.model_dump()) for row, student in students], "rejected": rejected, "chunk_size": chunk_size}
+        return await _submit_job("students.bulk_import", payload, current_user)
+    try:
+        created, duplicates = await crud.bulk_create_students(db, students, chunk_size=chunk_size)
+    except crud.StudentImportConflictError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    rejected.extend({"row": row, "error": error} for row, error in duplicates)
+    return _bulk_result(created, rejected)
+
 @app.get("/students/", response_model=list[schemas.Student])
-async def read_students(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
-    return await crud.get_students(db, skip=skip, limit=limit)
+async def read_students(request: Request, skip: int = 0, limit: int = 100, cursor: str | None = None, order_by: Literal["id", "name"] = "id", db: AsyncSession = Depends(get_cache_fill_db), current_user: schemas.User = Depends(get_current_user)):
+    if skip and (cursor or order_by != "id"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="skip cannot be combined with cursor pagination")
+
+    async def load():
+        if skip:
+            return cache.CachedResponse.from_body(_rows_body(await crud.get_students(db, skip=skip, limit=limit)))
+        try:
+            after = decode_cursor(cursor, order_by)
+        except InvalidCursorError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        students = await crud.get_students_after(db, after=after, limit=limit, order_by=order_by)
+        headers = {}
+        if limit > 0 and len(students) == limit:
+            headers["X-Next-Cursor"] = encode_cursor(order_by, students[-1])
+        return cache.CachedResponse.from_body(_rows_body(students), headers)
+
+    return await conditional_list_response(request, "students", (skip, limit, cursor or "", order_by), load)
+
+async def _student_stream(db, after: dict | None, order_by: str, fmt: str):
+    first = True
+    if fmt == "json":
+        yield b"["
+    async for student in crud.stream_students(db, after=after, order_by=order_by):
+        row = orjson.dumps(student._asdict())
+        if fmt == "json":
+            yield row if first else b"," + row
+        else:
+            yield row + b"\n"
+        first = False
+    if fmt == "json":
+        yield b"]"
+
+@app.get("/students/stream")
+async def stream_students(cursor: str | None = None, order_by: Literal["id", "name"] = "id", format: Literal["ndjson", "json"] = "ndjson", db: AsyncSession = Depends(get_read_db), current_user: schemas.User = Depends(get_current_user)):
+    try:
+        after = decode_cursor(cursor, order_by)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    media_type = "application/json" if format == "json" else "application/x-ndjson"
+    return StreamingResponse(_student_stream(db, after, order_by, format), media_type=media_type)
+
+@app.get("/students/search", response_model=list[schemas.Student])
+async def search_students(response: Response, q: str, limit: int = 20, cursor: str | None = None, db: AsyncSession = Depends(get_read_db), current_user: schemas.User = Depends(get_current_user)):
+    if db.bind.dialect.name != "sqlite":
+        return await crud.search_students(db, q, limit=limit)
+    try:
+        after = decode_search_cursor(cursor, q)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    rows = await crud.search_students_ranked(db, q, after=after, limit=limit)
+    if limit > 0 and len(rows) == limit:
+        student, rank = rows[-1]
+        response.headers["X-Next-Cursor"] = encode_search_cursor(q, rank, student.id)
+    return [student for student, _ in rows]
 
 @app.get("/students/{student_id}", response_model=schemas.Student)
-async def read_student(student_id: int, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
-    db_student = await crud.get_student(db, student_id=student_id)
-    if db_student is None:
+async def read_student(request: Request, student_id: int, db: AsyncSession = Depends(get_cache_fill_db), current_user: schemas.User = Depends(get_current_user)):
+    async def load():
+        db_student = await crud.get_student(db, student_id=student_id)
+        if db_student is None:
+            return None
+        return cache.CachedResponse.from_body(schemas.Student.model_validate(db_student, from_attributes=True).model_dump_json().encode())
+
+    entry = await cache.response_cache.get_or_load(f"student:{student_id}", load)
+    if entry is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Student not found")
-    return db_student
+    return cached_json_response(request, entry)
 
 @app.post("/users/", response_model=schemas.User)
 async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
-    db_user = await crud.get_user_by_username(db, username=user.username)
-    if db_user:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username already registered")
-    return await crud.create_user(db=db, user=user)
+    try:
+        return await crud.create_user(db=db, user=user)
+    except crud.DuplicateUsernameError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check(db: AsyncSession = Depends(get_db)):
+    """Ready once the database answers and is migrated to the revision this code expects."""
+    head = migration_head()
+    try:
+        await db.execute(text("SELECT 1"))
+        revision = await schema_revision(db)
+    except SQLAlchemyError as e:
+        logger.warning("readiness check failed", extra={"fields": {"error": str(e)}})
+        return JSONResponse({"status": "unavailable", "database": "unreachable", "head": head}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    body = {"status": "ready", "database": "ok", "revision": revision, "head": head}
+    if revision != head:
+        body["status"] = "migrations_pending"
+        return JSONResponse(body, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return body
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+async def cache_stats(current_user: schemas.User = Depends(get_current_user)):
+    return cache.stats()
+
+@app.get("/runtime/stats")
+async def runtime_stats(current_user: schemas.User = Depends(get_current_user)):
+    return {"password_hashing": passwords.stats(), "db_pool": get_pool_stats(), "admission": ratelimit.gate.stats(), "jobs": jobs.queue.stats(), "token_revocations": tokens.revocations.stats()}
+
+@app.get("/debug/queries")
+async def query_profile(current_user: schemas.User = Depends(get_current_user)):
+    """Statement totals and recent request profiles; 404 unless QUERY_PROFILING_ENABLED."""
+    if not profiling.enabled:
+        raise HTTPException(status_code=404, detail="Query profiling is disabled")
+    return profiling.report()
+
+@app.get("/jobs/{job_id}", response_model=schemas.Job)
+async def read_job(job_id: str, current_user: schemas.User = Depends(get_current_user)):
+    job = await jobs.queue.get(job_id)
+    if job is None or job.owner != current_user.username:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 # New endpoints
 @app.post("/courses/", response_model=schemas.Course, status_code=status.HTTP_201_CREATED)
 async def create_course(course: schemas.CourseCreate, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
     return await crud.create_course(db=db, course=course)
 
 @app.get("/courses/{course_id}", response_model=schemas.Course)
-async def read_course(course_id: int, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
-    db_course = await crud.get_course(db, course_id=course_id)
-    if db_course is None:
+async def read_course(request: Request, course_id: int, db: AsyncSession = Depends(get_cache_fill_db), current_user: schemas.User = Depends(get_current_user)):
+    async def load():
+        db_course = await crud.get_course(db, course_id=course_id)
+        if db_course is None:
+            return None
+        return cache.CachedResponse.from_body(schemas.Course.model_validate(db_course, from_attributes=True).model_dump_json().encode())
+
+    entry = await cache.response_cache.get_or_load(f"course:{course_id}", load)
+    if entry is None:
         raise HTTPException(status_code=404, detail="Course not found")
-    return db_course
+    return cached_json_response(request, entry)
 
 @app.post("/enrollments", response_model=dict)
 async def enroll_student(enrollment: schemas.EnrollmentCreate, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
     await crud.create_enrollment(db=db, enrollment=enrollment)
     return {"message": "Enrollment successful"}
 
-@app.get("/students/{student_id}/courses/", response_model=schemas.StudentEnrolledCourses)
-async def read_student_courses(student_id: int, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
-    courses = await crud.get_enrolled_courses(db, student_id=student_id)
-    return {"enrolled_courses": courses}
\ No newline at end of file
+def _batch_result(enrollments, statuses) -> dict:
+    return {"results": [
+        {"student_id": e.student_id, "course_id": e.course_id, "status": s}
+        for e, s in zip(enrollments, statuses)
+    ]}
+
+# A conflicting concurrent write (EnrollmentConflictError) is retried by the job queue
+@jobs.handler("enrollments.batch")
+async def _enrollment_batch_job(db: AsyncSession, payload: dict) -> dict:
+    enrollments = [schemas.EnrollmentCreate.model_validate(e) for e in payload["enrollments"]]
+    statuses = await crud.bulk_create_enrollments(db, enrollments, chunk_size=BULK_INSERT_CHUNK_SIZE)
+    return _batch_result(enrollments, statuses)
+
+@app.post("/enrollments/batch", response_model=schemas.EnrollmentBatchResult, responses={202: {"model": schemas.Job}})
+async def enroll_students_batch(enrollments: list[schemas.EnrollmentCreate], background: bool = False, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    if background:
+        return await _submit_job("enrollments.batch", {"enrollments": [e.model_dump() for e in enrollments]}, current_user)
+    try:
+        statuses = await crud.bulk_create_enrollments(db, enrollments, chunk_size=BULK_INSERT_CHUNK_SIZE)
+    except crud.EnrollmentConflictError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return _batch_result(enrollments, statuses)
+
+@app.get("/students/{student_id}/courses/", response_model=schemas.StudentEnrolledCourses | schemas.StudentEnrolledCourseDetails)
+async def read_student_courses(request: Request, student_id: int, expand: Literal["courses"] | None = None, db: AsyncSession = Depends(get_cache_fill_db), current_user: schemas.User = Depends(get_current_user)):
+    async def load():
+        if expand == "courses":
+            courses = await crud.get_enrolled_course_details(db, student_id=student_id)
+            return cache.CachedResponse.from_body(schemas.StudentEnrolledCourseDetails.model_validate({"enrolled_courses": courses}, from_attributes=True).model_dump_json().encode())
+        courses = await crud.get_enrolled_courses(db, student_id=student_id)
+        return cache.CachedResponse.from_body(schemas.StudentEnrolledCourses(enrolled_courses=courses).model_dump_json().encode())
+
+    entry = await cache.response_cache.get_or_load(f"student:{student_id}:courses:{expand or 'ids'}", load)
+    return cached_json_response(request, entry)
+
+@app.get("/courses/{course_id}/students", response_model=schemas.CourseEnrolledStudents)
+async def read_course_students(request: Request, course_id: int, db: AsyncSession = Depends(get_cache_fill_db), current_user: schemas.User = Depends(get_current_user)):
+    async def load():
+        students = await crud.get_course_students(db, course_id=course_id)
+        return cache.CachedResponse.from_body(schemas.CourseEnrolledStudents.model_validate({"enrolled_students": students}, from_attributes=True).model_dump_json().encode())
+
+    entry = await cache.response_cache.get_or_load(f"course:{course_id}:students", load)
+    return cached_json_response(request, entry)
+
+# Aggregate statistics
+@app.get("/stats/courses/enrollments", response_model=list[schemas.CourseEnrollmentCount])
+async def course_enrollment_stats(request: Request, skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_cache_fill_db), current_user: schemas.User = Depends(get_current_user)):
+    async def load():
+        rows = await crud.get_course_enrollment_counts(db, skip=skip, limit=limit)
+        return cache.CachedResponse.from_body(orjson.dumps([
+            {"course_id": id_, "title": title, "enrollment_count": count} for id_, title, count in rows
+        ]))
+
+    return await conditional_list_response(request, "course-counts", ("enrollments", skip, limit), load)
+
+@app.get("/stats/courses/popular", response_model=list[schemas.PopularCourse])
+async def popular_courses(request: Request, limit: int = 10, db: AsyncSession = Depends(get_cache_fill_db), current_user: schemas.User = Depends(get_current_user)):
+    async def load():
+        rows = await crud.get_popular_courses(db, limit=limit)
+        return cache.CachedResponse.from_body(orjson.dumps([
+            {"rank": rank, "course_id": id_, "title": title, "enrollment_count": count}
+            for rank, (id_, title, count) in enumerate(rows, 1)
+        ]))
+
+    return await conditional_list_response(request, "course-counts", ("popular", limit), load)
+
+@app.get("/stats/courses/{course_id}/enrollments", response_model=schemas.CourseEnrollmentCount)
+async def course_enrollment_count(course_id: int, db: AsyncSession = Depends(get_read_db), current_user: schemas.User = Depends(get_current_user)):
+    row = await crud.get_course_enrollment_count(db, course_id=course_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Course not found")
+    id_, title, count = row
+    return {"course_id": id_, "title": title, "enrollment_count": count}
+
+@jobs.handler("stats.recompute_course_counts")
+async def _recompute_course_counts_job(db: AsyncSession, payload: dict) -> dict:
+    return {"courses": await crud.recompute_course_enrollment_counts(db)}
+
+@app.post("/stats/courses/recompute", status_code=status.HTTP_202_ACCEPTED, response_model=schemas.Job)
+async def recompute_course_counts(current_user: schemas.User = Depends(get_current_user)):
+    """Rebuild the per-course enrollment totals from the enrollments table in the background."""
+    return await _submit_job("stats.recompute_course_counts", {}, current_user)
+
+@app.get("/stats/students/age-brackets", response_model=list[schemas.AgeBracket])
+async def student_age_brackets(request: Request, width: int = 5, db: AsyncSession = Depends(get_cache_fill_db), current_user: schemas.User = Depends(get_current_user)):
+    if width < 1:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="width must be at least 1")
+
+    async def load():
+        rows = await crud.get_age_brackets(db, width=width)
+        brackets = [{"min_age": low, "max_age": low + width - 1, "student_count": count} for low, count in rows]
+        return cache.CachedResponse.from_body(json.dumps(brackets).encode())
+
+    # Scans every student, so it is cached under the students namespace that writes bump
+    return await conditional_list_response(request, "students", ("age-brackets", width), load)
+
+# Bulk exports
+def _export_response(request: Request, name: str, columns, batches, fmt: str):
+    if fmt == "parquet":
+        if export.pyarrow is None:
+            raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail="Parquet export requires the 'pyarrow' package")
+        # Parquet pages are already compressed, so only CSV is gzipped
+        return StreamingResponse(export.parquet_chunks(columns, batches), media_type=export.EXPORT_MEDIA_TYPES[fmt],
+                                 headers={"Content-Disposition": f'attachment; filename="{name}.parquet"'})
+    headers = {"Content-Disposition": f'attachment; filename="{name}.csv"', "Vary": "Accept-Encoding"}
+    body = export.csv_chunks(columns, batches)
+    if export.accepts_gzip(request.headers.get("accept-encoding", "")):
+        headers["Content-Encoding"] = "gzip"
+        body = export.gzip_chunks(body, EXPORT_GZIP_LEVEL)
+    return StreamingResponse(body, media_type=export.EXPORT_MEDIA_TYPES[fmt], headers=headers)
+
+@app.get("/export/students")
+async def export_students(request: Request, format: Literal["csv", "parquet"] = "csv", course_id: int | None = None, db: AsyncSession = Depends(get_read_db), current_user: schemas.User = Depends(get_current_user)):
+    batches = crud.stream_student_rows(db, course_id=course_id, batch_size=EXPORT_BATCH_SIZE)
+    return _export_response(request, "students", export.STUDENT_COLUMNS, batches, format)
+
+@app.get("/export/enrollments")
+async def export_enrollments(request: Request, format: Literal["csv", "parquet"] = "csv", course_id: int | None = None, db: AsyncSession = Depends(get_read_db), current_user: schemas.User = Depends(get_current_user)):
+    batches = crud.stream_enrollment_rows(db, course_id=course_id, batch_size=EXPORT_BATCH_SIZE)
+    return _export_response(request, "enrollments", export.ENROLLMENT_COLUMNS, batches, format)
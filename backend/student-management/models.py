@@ -1,9 +1,7 @@
 # models.py
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, Float, Text, ForeignKey, Index, DDL, event
 from database import Base
 
-Base = declarative_base()
-
 class Student(Base):
     __tablename__ = "students"
 
@@ -12,6 +10,22 @@ class Student(Base):
     age = Column(Integer)
     email = Column(String, unique=True, index=True)
 
+# Full-text index over students (SQLite FTS5, external content), kept in sync by triggers
+STUDENT_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS students_fts USING fts5("
+    "name, email, content='students', content_rowid='id', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS students_fts_ai AFTER INSERT ON students BEGIN "
+    "INSERT INTO students_fts(rowid, name, email) VALUES (new.id, new.name, new.email); END",
+    "CREATE TRIGGER IF NOT EXISTS students_fts_ad AFTER DELETE ON students BEGIN "
+    "INSERT INTO students_fts(students_fts, rowid, name, email) VALUES ('delete', old.id, old.name, old.email); END",
+    "CREATE TRIGGER IF NOT EXISTS students_fts_au AFTER UPDATE ON students BEGIN "
+    "INSERT INTO students_fts(students_fts, rowid, name, email) VALUES ('delete', old.id, old.name, old.email); "
+    "INSERT INTO students_fts(rowid, name, email) VALUES (new.id, new.name, new.email); END",
+]
+
+for statement in STUDENT_FTS_DDL:
+    event.listen(Student.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+
 class User(Base):
     __tablename__ = "users"
 
@@ -19,6 +33,15 @@ class User(Base):
     username = Column(String, unique=True, index=True)
     hashed_password = Column(String)
     is_active = Column(Boolean, default=True)
+    # Tokens issued with a lower version are revoked; bumped to log a user out everywhere
+    token_version = Column(Integer, nullable=False, default=0, server_default="0", index=True)
+
+class RevokedToken(Base):
+    """Individually revoked access/refresh token ids, kept until the token would have expired."""
+    __tablename__ = "revoked_tokens"
+
+    jti = Column(String, primary_key=True)
+    expires_at = Column(Float, nullable=False, index=True)
 
 class Course(Base):
     __tablename__ = "courses"
@@ -32,4 +55,43 @@ class Enrollment(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     student_id = Column(Integer, ForeignKey('students.id'))
-    course_id = Column(Integer, ForeignKey('courses.id'))
\ No newline at end of file
+    course_id = Column(Integer, ForeignKey('courses.id'))
+
+    # The composite index also serves student_id lookups; course_id needs its own
+    __table_args__ = (
+        Index("ix_enrollments_student_course", "student_id", "course_id", unique=True),
+        Index("ix_enrollments_course_id", "course_id"),
+    )
+
+class CourseEnrollmentCount(Base):
+    """Per-course enrollment totals, maintained by the enrollment write path."""
+    __tablename__ = "course_enrollment_counts"
+
+    course_id = Column(Integer, ForeignKey('courses.id'), primary_key=True)
+    enrollment_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_course_enrollment_counts_count", "enrollment_count"),
+    )
+
+class Job(Base):
+    """Background jobs when JOB_STORE=database; times are Unix epoch seconds."""
+    __tablename__ = "jobs"
+
+    id = Column(String(32), primary_key=True)
+    kind = Column(String, nullable=False)
+    owner = Column(String)
+    status = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)  # JSON
+    result = Column(Text)  # JSON
+    error = Column(String)
+    attempts = Column(Integer, nullable=False, default=0)
+    run_after = Column(Float, nullable=False)
+    locked_until = Column(Float)
+    created_at = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)
+
+    # Workers claim the oldest due job by status and run_after
+    __table_args__ = (
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+    )
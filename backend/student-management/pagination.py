@@ -0,0 +1,46 @@
+# pagination.py
+import base64
+import json
+from typing import Optional
+
+class InvalidCursorError(Exception):
+    pass
+
+def _encode(payload: dict) -> str:
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode(cursor: str, kind: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursorError("Invalid cursor")
+    if not isinstance(payload, dict) or payload.get("o") != kind or not isinstance(payload.get("id"), int):
+        raise InvalidCursorError("Cursor does not match the requested ordering")
+    return payload
+
+def encode_cursor(order_by: str, student) -> str:
+    payload = {"o": order_by, "id": student.id}
+    if order_by == "name":
+        payload["name"] = student.name
+    return _encode(payload)
+
+def decode_cursor(cursor: Optional[str], order_by: str) -> Optional[dict]:
+    if not cursor:
+        return None
+    payload = _decode(cursor, order_by)
+    if order_by == "name" and not isinstance(payload.get("name"), str):
+        raise InvalidCursorError("Invalid cursor")
+    return payload
+
+def encode_search_cursor(query: str, rank: float, student_id: int) -> str:
+    return _encode({"o": "search", "q": query, "rank": rank, "id": student_id})
+
+def decode_search_cursor(cursor: Optional[str], query: str) -> Optional[dict]:
+    if not cursor:
+        return None
+    payload = _decode(cursor, "search")
+    if payload.get("q") != query or not isinstance(payload.get("rank"), (int, float)):
+        raise InvalidCursorError("Cursor does not match the search query")
+    return payload
@@ -0,0 +1,85 @@
+# passwords.py
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from passlib.context import CryptContext
+
+import metrics
+from config import PASSWORD_HASH_EXECUTOR, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_CONCURRENCY
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+_executor: Optional[Executor] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+_semaphore_loop = None
+_metrics = {"waiting": 0, "in_flight": 0, "max_waiting": 0, "completed": 0, "wait_seconds": 0.0, "run_seconds": 0.0}
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+def _verify(password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(password, hashed_password)
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if PASSWORD_HASH_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+    return _executor
+
+def _get_semaphore() -> asyncio.Semaphore:
+    # Semaphores bind to the loop they first wait on, so rebuild one per loop.
+    global _semaphore, _semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _semaphore is None or _semaphore_loop is not loop:
+        _semaphore = asyncio.Semaphore(PASSWORD_HASH_MAX_CONCURRENCY)
+        _semaphore_loop = loop
+    return _semaphore
+
+async def _run(func, *args):
+    queued_at = time.perf_counter()
+    _metrics["waiting"] += 1
+    _metrics["max_waiting"] = max(_metrics["max_waiting"], _metrics["waiting"])
+    acquired = False
+    try:
+        async with _get_semaphore():
+            acquired = True
+            _metrics["waiting"] -= 1
+            _metrics["in_flight"] += 1
+            started_at = time.perf_counter()
+            _metrics["wait_seconds"] += started_at - queued_at
+            try:
+                return await asyncio.get_running_loop().run_in_executor(_get_executor(), func, *args)
+            finally:
+                elapsed = time.perf_counter() - started_at
+                _metrics["in_flight"] -= 1
+                _metrics["completed"] += 1
+                _metrics["run_seconds"] += elapsed
+                metrics.PASSWORD_HASH_LATENCY.observe(elapsed, func.__name__.lstrip("_"))
+    finally:
+        if not acquired:
+            _metrics["waiting"] -= 1
+
+async def hash_password(password: str) -> str:
+    return await _run(_hash, password)
+
+async def verify_password(password: str, hashed_password: str) -> bool:
+    return await _run(_verify, password, hashed_password)
+
+def stats() -> dict:
+    return {
+        "executor": PASSWORD_HASH_EXECUTOR,
+        "workers": PASSWORD_HASH_WORKERS,
+        "max_concurrency": PASSWORD_HASH_MAX_CONCURRENCY,
+        **_metrics,
+    }
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
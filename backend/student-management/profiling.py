@@ -0,0 +1,160 @@
+# profiling.py
+"""Opt-in per-request SQL profiling (QUERY_PROFILING_ENABLED).
+
+Engine hooks attribute every statement to the request that ran it, through a context
+variable the profiling middleware sets. Each request gets a Server-Timing header;
+statements slower than QUERY_SLOW_MS are logged with their query plan; a statement
+repeated QUERY_N_PLUS_ONE_THRESHOLD times in one request is flagged as a likely N+1.
+"""
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+
+from config import settings
+
+logger = logging.getLogger("profiling")
+
+enabled = settings.QUERY_PROFILING_ENABLED
+slow_ms = settings.QUERY_SLOW_MS
+n_plus_one_threshold = settings.QUERY_N_PLUS_ONE_THRESHOLD
+
+_EXPLAIN_PREFIX = {"sqlite": "EXPLAIN QUERY PLAN ", "postgresql": "EXPLAIN "}
+# Expanded IN lists differ in length per call; collapse them so the statements still group
+_PLACEHOLDER = r"(?:\?|%s|%\(\w+\)s|\$\d+|:\w+)"
+_IN_LIST = re.compile(rf"\bIN \(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})*\s*\)", re.IGNORECASE)
+
+def normalize(statement: str) -> str:
+    return _IN_LIST.sub("IN (...)", " ".join(statement.split()))
+
+class RequestProfile:
+    def __init__(self, method: str, path: str):
+        self.method, self.path = method, path
+        self.route = None
+        self.finished = False
+        self.started = time.perf_counter()
+        self.duration_ms = 0.0
+        self.queries = 0
+        self.db_ms = 0.0
+        self.statements = {}  # normalized statement -> [count, total ms, max ms]
+        self.slow = []
+        self.n_plus_one = []
+
+    def record(self, statement: str, elapsed_ms: float) -> tuple:
+        """Count one statement; returns (normalized statement, times seen in this request)."""
+        key = normalize(statement)
+        entry = self.statements.setdefault(key, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed_ms
+        entry[2] = max(entry[2], elapsed_ms)
+        self.queries += 1
+        self.db_ms += elapsed_ms
+        return key, entry[0]
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.db_ms:.2f};desc="{self.queries} queries", app;dur={max(self.duration_ms - self.db_ms, 0):.2f}'
+
+    def summary(self) -> dict:
+        top = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)[:5]
+        return {
+            "method": self.method, "route": self.route or self.path, "duration_ms": round(self.duration_ms, 2),
+            "queries": self.queries, "db_ms": round(self.db_ms, 2),
+            "top_statements": [{"statement": s, "count": c, "total_ms": round(ms, 2)} for s, (c, ms, _) in top],
+            "slow": self.slow, "n_plus_one": self.n_plus_one,
+        }
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("query_profile", default=None)
+_recent = deque(maxlen=settings.QUERY_PROFILE_HISTORY)
+_totals: "OrderedDict[str, list]" = OrderedDict()  # statement -> [count, total ms, max ms], across requests
+_lock = threading.Lock()
+
+def begin(method: str, path: str) -> RequestProfile:
+    profile = RequestProfile(method, path)
+    _current.set(profile)
+    return profile
+
+def finish(profile: RequestProfile, route: Optional[str]):
+    profile.route = route
+    profile.finished = True
+    profile.duration_ms = (time.perf_counter() - profile.started) * 1000
+    with _lock:
+        _recent.append(profile.summary())
+        for statement, (count, total_ms, max_ms) in profile.statements.items():
+            entry = _totals.get(statement)
+            if entry is None:
+                if len(_totals) >= settings.QUERY_PROFILE_MAX_STATEMENTS:
+                    _totals.popitem(last=False)
+                entry = _totals[statement] = [0, 0.0, 0.0]
+            entry[0] += count
+            entry[1] += total_ms
+            entry[2] = max(entry[2], max_ms)
+
+def _explain(conn, statement: str, parameters) -> Optional[list]:
+    prefix = _EXPLAIN_PREFIX.get(conn.dialect.name)
+    if prefix is None:
+        return None
+    # A raw DBAPI cursor, so the EXPLAIN is not itself timed or profiled
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        return [" ".join(str(part) for part in row) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+def instrument_engine(engine, name: str):
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        profile = _current.get()
+        if profile is not None and not profile.finished:
+            # On the execution context, so a statement that raises leaves nothing behind
+            context._profile_start = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        # Tasks spawned during a request inherit its context; stop counting once the request is done
+        profile = _current.get()
+        started = getattr(context, "_profile_start", None)
+        if profile is None or profile.finished or started is None:
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        key, seen = profile.record(statement, elapsed_ms)
+        if seen == n_plus_one_threshold:
+            profile.n_plus_one.append({"statement": key, "count": seen})
+            logger.warning("possible N+1 query", extra={"fields": {"path": profile.path, "statement": key, "count": seen, "engine": name}})
+        if elapsed_ms >= slow_ms:
+            plan = None
+            if not executemany:
+                try:
+                    plan = _explain(conn, statement, parameters)
+                except Exception as e:
+                    plan = [f"EXPLAIN failed: {e}"]
+            profile.slow.append({"statement": key, "duration_ms": round(elapsed_ms, 2), "plan": plan})
+            logger.warning("slow query", extra={"fields": {
+                "path": profile.path, "engine": name, "duration_ms": round(elapsed_ms, 2), "statement": key, "plan": plan,
+            }})
+
+def report() -> dict:
+    with _lock:
+        top = sorted(_totals.items(), key=lambda item: item[1][1], reverse=True)[:20]
+        return {
+            "enabled": enabled,
+            "slow_ms": slow_ms,
+            "n_plus_one_threshold": n_plus_one_threshold,
+            "statements": [
+                {"statement": s, "count": c, "total_ms": round(total, 2), "max_ms": round(worst, 2)}
+                for s, (c, total, worst) in top
+            ],
+            "recent_requests": list(_recent),
+        }
+
+def reset():
+    with _lock:
+        _recent.clear()
+        _totals.clear()
@@ -0,0 +1,121 @@
+# ratelimit.py
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from config import settings
+
+@dataclass(frozen=True)
+class Rule:
+    """Token bucket refilled at per_minute tokens a minute, holding at most burst."""
+    per_minute: float
+    burst: int
+
+    @property
+    def interval_ns(self) -> int:
+        return round(60e9 / self.per_minute)
+
+def _advance(tat: Optional[int], rule: Rule, now: int):
+    """GCRA step: the bucket is one "theoretical arrival time" per key instead of a (tokens, timestamp) pair.
+
+    Times are integer nanoseconds: in float seconds, rounding at clock-sized values could
+    leave a request that exactly fits the burst a hair over it. Returns (new_tat, retry_after
+    seconds); new_tat is None when the request is rejected.
+    """
+    new_tat = max(tat or now, now) + rule.interval_ns
+    excess = new_tat - now - rule.burst * rule.interval_ns
+    if excess > 0:
+        return None, excess / 1e9
+    return new_tat, 0.0
+
+class MemoryBuckets:
+    """Per-process buckets; the least recently used key is dropped (reset to full) past max_keys."""
+
+    def __init__(self, max_keys: int = 100000):
+        self._tats: "OrderedDict[str, int]" = OrderedDict()
+        self.max_keys = max_keys
+
+    async def take(self, key: str, rule: Rule) -> float:
+        now = time.monotonic_ns()
+        new_tat, retry_after = _advance(self._tats.get(key), rule, now)
+        if new_tat is not None:
+            self._tats[key] = new_tat
+            self._tats.move_to_end(key)
+            if len(self._tats) > self.max_keys:
+                self._tats.popitem(last=False)
+        return retry_after
+
+class RedisBuckets:
+    """Buckets shared by every worker through a Redis-compatible server (WATCH/MULTI, no Lua needed)."""
+
+    def __init__(self, url: str, prefix: str = "sm:gcra:"):
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the 'redis' package")
+        self._client = redis_asyncio.from_url(url)
+        self._prefix = prefix
+
+    async def take(self, key: str, rule: Rule) -> float:
+        from redis.exceptions import WatchError
+
+        key = self._prefix + key
+        async with self._client.pipeline() as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    stored = await pipe.get(key)
+                    now = time.time_ns()
+                    new_tat, retry_after = _advance(int(stored) if stored else None, rule, now)
+                    if new_tat is None:
+                        await pipe.unwatch()
+                        return retry_after
+                    pipe.multi()
+                    pipe.set(key, new_tat, px=math.ceil((new_tat - now) / 1e6))
+                    await pipe.execute()
+                    return 0.0
+                except WatchError:
+                    continue
+
+class AdmissionGate:
+    """Caps concurrent expensive requests; callers over the cap are turned away instead of queued."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = 0
+
+    def try_enter(self) -> bool:
+        if self.in_flight >= self.limit:
+            self.shed += 1
+            return False
+        self.in_flight += 1
+        self.admitted += 1
+        return True
+
+    def leave(self):
+        self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "in_flight": self.in_flight, "admitted": self.admitted, "shed": self.shed}
+
+def retry_after_header(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
+
+LOGIN_RULE = Rule(settings.RATE_LIMIT_LOGIN_PER_MINUTE, settings.RATE_LIMIT_LOGIN_BURST)
+WRITE_RULE = Rule(settings.RATE_LIMIT_WRITE_PER_MINUTE, settings.RATE_LIMIT_WRITE_BURST)
+
+# bcrypt on /token and /users/, and the bulk/export routes, are what saturate a worker
+LOGIN_PATHS = frozenset({"/token", "/users/"})
+EXPENSIVE_PATHS = frozenset({"/token", "/users/", "/students/bulk", "/enrollments/batch", "/export/students", "/export/enrollments"})
+
+def _build_buckets():
+    if settings.RATE_LIMIT_BACKEND == "redis":
+        return RedisBuckets(settings.RATE_LIMIT_URL)
+    return MemoryBuckets()
+
+buckets = _build_buckets()
+gate = AdmissionGate(settings.ADMISSION_MAX_CONCURRENCY)
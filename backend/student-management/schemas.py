@@ -1,6 +1,7 @@
 # schemas.py
-from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from datetime import datetime
+from pydantic import BaseModel, ConfigDict, EmailStr
+from typing import Any, List, Optional
 
 class StudentBase(BaseModel):
     name: str
@@ -13,8 +14,19 @@ class StudentCreate(StudentBase):
 class Student(StudentBase):
     id: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+class BulkCreatedRow(BaseModel):
+    row: int
+    id: int
+
+class BulkRejectedRow(BaseModel):
+    row: int
+    error: str
+
+class StudentBulkResult(BaseModel):
+    created: List[BulkCreatedRow]
+    rejected: List[BulkRejectedRow]
 
 class UserBase(BaseModel):
     username: str
@@ -26,8 +38,7 @@ class User(UserBase):
     id: int
     is_active: bool
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class Token(BaseModel):
     access_token: str
@@ -44,12 +55,50 @@ class CourseCreate(CourseBase):
 class Course(CourseBase):
     id: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class EnrollmentCreate(BaseModel):
     student_id: int
     course_id: int
 
+class EnrollmentBatchStatus(BaseModel):
+    student_id: int
+    course_id: int
+    status: str
+
+class EnrollmentBatchResult(BaseModel):
+    results: List[EnrollmentBatchStatus]
+
 class StudentEnrolledCourses(BaseModel):
-    enrolled_courses: List[int]
\ No newline at end of file
+    enrolled_courses: List[int]
+
+class StudentEnrolledCourseDetails(BaseModel):
+    enrolled_courses: List[Course]
+
+class CourseEnrolledStudents(BaseModel):
+    enrolled_students: List[Student]
+
+class CourseEnrollmentCount(BaseModel):
+    course_id: int
+    title: str
+    enrollment_count: int
+
+class PopularCourse(CourseEnrollmentCount):
+    rank: int
+
+class AgeBracket(BaseModel):
+    min_age: int
+    max_age: int
+    student_count: int
+
+class Job(BaseModel):
+    id: str
+    kind: str
+    status: str
+    attempts: int
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
@@ -0,0 +1,156 @@
+# serve.py
+"""Run the API in N worker processes that share one listening socket.
+
+    python serve.py --workers 4 --port 8000
+
+The parent binds the socket, spawns the workers and waits for each one to report
+that it is serving before declaring the service ready (and touching --ready-file).
+SIGTERM or SIGINT drains: workers stop accepting, finish in-flight requests for up
+to GRACEFUL_SHUTDOWN_SECONDS, then exit. A worker that dies unexpectedly is
+replaced.
+
+Per-process state (response cache, rate-limit buckets) is moved to a shared Redis
+backend. SHARED_STATE_URL names one; without it, a multi-worker launch starts a
+local in-process Redis stand-in (fakeredis) for development. Background jobs move
+to the database job store, so any worker can answer /jobs/{id} and a job outlives
+the worker that accepted it.
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from pathlib import Path
+
+from config import settings
+
+logger = logging.getLogger("serve")
+
+def _worker(sock: socket.socket, ready, log_level: str):
+    import uvicorn
+
+    config = uvicorn.Config("main:app", log_level=log_level, timeout_graceful_shutdown=settings.GRACEFUL_SHUTDOWN_SECONDS)
+    server = uvicorn.Server(config)
+
+    async def announce_when_started():
+        while not server.started:
+            if server.should_exit:
+                return
+            await asyncio.sleep(0.05)
+        ready.put(os.getpid())
+
+    async def run():
+        announcer = asyncio.create_task(announce_when_started())
+        await server.serve(sockets=[sock])
+        announcer.cancel()
+
+    asyncio.run(run())
+
+def _start_shared_state():
+    """Point every worker at one Redis for response caching and rate limiting."""
+    url = settings.SHARED_STATE_URL
+    stand_in = None
+    if not url:
+        try:
+            from fakeredis import TcpFakeServer
+        except ImportError:
+            logger.warning("no SHARED_STATE_URL and fakeredis is not installed; caches and rate limits stay per-worker")
+            return None
+        stand_in = TcpFakeServer(("127.0.0.1", 0))
+        threading.Thread(target=stand_in.serve_forever, name="shared-state", daemon=True).start()
+        host, port = stand_in.server_address
+        url = f"redis://{host}:{port}/0"
+        logger.info("started local shared-state stand-in at %s", url)
+    # Workers read these through config.Settings when they import the app
+    os.environ.update({
+        "RESPONSE_CACHE_BACKEND": "redis", "RESPONSE_CACHE_URL": url,
+        "RATE_LIMIT_BACKEND": "redis", "RATE_LIMIT_URL": url,
+    })
+    return stand_in
+
+def serve(host: str, port: int, workers: int, ready_file: str | None = None, log_level: str = "info"):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    stand_in = None
+    if workers > 1:
+        stand_in = _start_shared_state()
+        if settings.JOB_STORE == "memory":
+            logger.info("using JOB_STORE=database so every worker sees the same jobs")
+            os.environ["JOB_STORE"] = "database"
+    context = multiprocessing.get_context("spawn")
+    ready = context.Queue()
+    processes = []
+    draining = threading.Event()
+
+    def spawn():
+        process = context.Process(target=_worker, args=(sock, ready, log_level), daemon=False)
+        process.start()
+        return process
+
+    def drain(signum, frame):
+        logger.info("received %s, draining %d workers", signal.Signals(signum).name, len(processes))
+        draining.set()
+
+    signal.signal(signal.SIGTERM, drain)
+    signal.signal(signal.SIGINT, drain)
+
+    processes.extend(spawn() for _ in range(workers))
+    started = set()
+    deadline = time.monotonic() + 60
+    while len(started) < workers and not draining.is_set() and time.monotonic() < deadline:
+        try:
+            started.add(ready.get(timeout=0.5))
+        except Exception:  # queue.Empty
+            continue
+    if len(started) == workers:
+        logger.info("%d workers serving on %s:%d", workers, host, port)
+        if ready_file:
+            Path(ready_file).write_text(str(os.getpid()))
+    elif not draining.is_set():
+        logger.error("only %d of %d workers started", len(started), workers)
+        draining.set()
+
+    while not draining.wait(0.5):
+        for i, process in enumerate(processes):
+            if not process.is_alive():
+                logger.warning("worker %d exited with %s; restarting", process.pid, process.exitcode)
+                processes[i] = spawn()
+
+    if ready_file:
+        Path(ready_file).unlink(missing_ok=True)
+    for process in processes:
+        if process.is_alive():
+            os.kill(process.pid, signal.SIGTERM)
+    deadline = time.monotonic() + settings.GRACEFUL_SHUTDOWN_SECONDS + 5
+    for process in processes:
+        process.join(max(0, deadline - time.monotonic()))
+        if process.is_alive():
+            logger.warning("worker %d did not drain in time; killing it", process.pid)
+            process.kill()
+            process.join()
+    sock.close()
+    if stand_in is not None:
+        stand_in.shutdown()
+    logger.info("all workers stopped")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=settings.WEB_CONCURRENCY or os.cpu_count() or 1)
+    parser.add_argument("--ready-file", help="created once every worker is serving, removed when draining starts")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s serve %(levelname)s %(message)s")
+    serve(args.host, args.port, args.workers, args.ready_file, args.log_level)
+
+if __name__ == "__main__":
+    main()
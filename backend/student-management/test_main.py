@@ -1,41 +1,65 @@
 # test_main.py
+import json
+
+import os
+import time
+
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.pool import StaticPool
 
 from main import app
-from database import Base, get_db
+import jobs
+import tokens
+from database import Base, get_db, get_read_db, get_cache_fill_db
+from config import settings
 from models import User, Student, Course, Enrollment  # Updated imports
 
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "sqlite+aiosqlite://")
+
 @pytest.fixture(scope="module")
 def test_db():
-    engine = create_engine(
-        "sqlite:///:memory:",
-        connect_args={"check_same_thread": False},
+    engine = create_async_engine(
+        TEST_DATABASE_URL,
+        connect_args={"check_same_thread": False} if TEST_DATABASE_URL.startswith("sqlite") else {},
         poolclass=StaticPool
     )
-    Base.metadata.create_all(bind=engine)
-    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    return TestingSessionLocal
+    return engine, async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 @pytest.fixture(scope="module")
 def override_get_db(test_db):
-    def _override_get_db():
-        db = test_db()
-        try:
+    _, TestingSessionLocal = test_db
+
+    async def _override_get_db():
+        async with TestingSessionLocal() as db:
             yield db
-        finally:
-            db.close()
     return _override_get_db
 
+async def _reset_schema(engine):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
 @pytest.fixture(scope="module")
-def client(override_get_db):
+def client(test_db, override_get_db):
+    engine, TestingSessionLocal = test_db
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    app.dependency_overrides[get_cache_fill_db] = override_get_db
+    jobs.queue.session_factory = TestingSessionLocal
+    tokens.revocations.session_factory = TestingSessionLocal
+    # Every test logs in from the same client address; test_rate_limiting turns limits back on
+    settings.RATE_LIMIT_ENABLED = False
     with TestClient(app) as c:
+        # The engine's connection belongs to the client's event loop, so build the schema there
+        c.portal.call(_reset_schema, engine)
         yield c
+        c.portal.call(engine.dispose)
     app.dependency_overrides.clear()
+    jobs.queue.session_factory = None
+    tokens.revocations.session_factory = None
+    settings.RATE_LIMIT_ENABLED = True
 
 def test_create_and_get_student(client):
     user_response = client.post("/users/", json={"username": "testuser", "password": "testpass"})
@@ -114,4 +138,864 @@ def test_enrollment_errors(client):
     # Try enrolling again (duplicate)
     response = client.post("/enrollments", json={"student_id": student_id, "course_id": course_id}, headers={"Authorization": f"Bearer {token}"})
     assert response.status_code == 400
-    assert response.json()["detail"] == "Already enrolled"
\ No newline at end of file
+    assert response.json()["detail"] == "Already enrolled"
+
+def test_student_cursor_pagination_and_stream(client):
+    client.post("/users/", json={"username": "testuser4", "password": "testpass"})
+    token_response = client.post("/token", data={"username": "testuser4", "password": "testpass"})
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+    for i, name in enumerate(["Zed", "Amy", "Moe"]):
+        client.post("/students/", json={"name": name, "age": 20 + i, "email": f"page{i}@example.com"}, headers=headers)
+
+    # Walk every page by id and by name using the opaque cursor
+    for order_by in ("id", "name"):
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 2, "order_by": order_by}
+            if cursor:
+                params["cursor"] = cursor
+            response = client.get("/students/", params=params, headers=headers)
+            assert response.status_code == 200
+            seen.extend(response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        keys = [s[order_by] for s in seen]
+        assert keys == sorted(keys)
+        assert len({s["id"] for s in seen}) == len(seen)
+
+    all_students = client.get("/students/", params={"limit": 1000}, headers=headers).json()
+    assert len(seen) == len(all_students)
+
+    # Cursor from one ordering cannot be replayed against another
+    cursor = client.get("/students/", params={"limit": 1, "order_by": "name"}, headers=headers).headers["X-Next-Cursor"]
+    response = client.get("/students/", params={"cursor": cursor}, headers=headers)
+    assert response.status_code == 400
+
+    # Streamed NDJSON and JSON array bodies contain every student
+    response = client.get("/students/stream", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert len(response.text.strip().splitlines()) == len(all_students)
+    response = client.get("/students/stream", params={"format": "json", "order_by": "name"}, headers=headers)
+    assert [s["name"] for s in response.json()] == sorted(s["name"] for s in all_students)
+
+
+def test_bulk_student_import(client, monkeypatch):
+    client.post("/users/", json={"username": "testuser5", "password": "testpass"})
+    token_response = client.post("/token", data={"username": "testuser5", "password": "testpass"})
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+    client.post("/students/", json={"name": "Existing", "age": 30, "email": "bulk-existing@example.com"}, headers=headers)
+
+    rows = [
+        {"name": "Bulk One", "age": 18, "email": "bulk1@example.com"},
+        {"name": "Bulk Dup", "age": 18, "email": "bulk-existing@example.com"},
+        {"name": "Bulk Bad", "age": "old", "email": "bulk2@example.com"},
+        {"name": "Bulk Two", "age": 19, "email": "bulk3@example.com"},
+        {"name": "Bulk Repeat", "age": 19, "email": "bulk1@example.com"},
+    ]
+    response = client.post("/students/bulk", params={"chunk_size": 2}, json=rows, headers=headers)
+    assert response.status_code == 200
+    result = response.json()
+    assert [r["row"] for r in result["created"]] == [0, 3]
+    assert [r["row"] for r in result["rejected"]] == [1, 2, 4]
+    assert result["rejected"][0]["error"] == "Email already registered"
+    created_id = result["created"][1]["id"]
+    assert client.get(f"/students/{created_id}", headers=headers).json()["email"] == "bulk3@example.com"
+
+    csv_body = "name,age,email\nCsv One,22,bulkcsv1@example.com\nCsv Two,23,bulkcsv2@example.com\n"
+    response = client.post("/students/bulk", content=csv_body, headers={**headers, "Content-Type": "text/csv"})
+    assert response.status_code == 200
+    assert len(response.json()["created"]) == 2
+    assert response.json()["rejected"] == []
+
+    # Simulate another request registering the email between the duplicate check and the insert
+    import crud
+    import sqlalchemy
+    monkeypatch.setattr(crud, "select", lambda *columns: sqlalchemy.select(*columns).where(sqlalchemy.false()))
+    rows = [{"name": "Racer", "age": 20, "email": "bulk-race@example.com"}, {"name": "Late", "age": 20, "email": "bulk-existing@example.com"}]
+    response = client.post("/students/bulk", json=rows, headers=headers)
+    assert response.status_code == 409
+    monkeypatch.undo()
+    # The partial import was rolled back, so the same row goes through on retry
+    assert len(client.post("/students/bulk", json=rows[:1], headers=headers).json()["created"]) == 1
+
+
+def test_auth_cache_hits_and_invalidation(client, monkeypatch):
+    import cache
+    import ratelimit
+
+    client.post("/users/", json={"username": "testuser6", "password": "testpass"})
+    token_response = client.post("/token", data={"username": "testuser6", "password": "testpass"})
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+
+    client.get("/students/", headers=headers)
+    hits_before = cache.token_cache.hits
+    stats = client.get("/cache/stats", headers=headers).json()
+    assert cache.token_cache.hits == hits_before + 1
+    assert stats["token_cache"]["size"] >= 1
+
+    cache.invalidate_user("testuser6")
+    assert cache.user_cache.get("testuser6") is None
+    misses_before = cache.token_cache.misses
+    assert client.get("/students/", headers=headers).status_code == 200
+    assert cache.token_cache.misses == misses_before + 1
+
+    assert client.get("/students/", headers={"Authorization": "Bearer not-a-token"}).status_code == 401
+
+    # The rate limiter reads the token too, but only authentication counts towards the stats
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(ratelimit, "buckets", ratelimit.MemoryBuckets())
+    hits_before = cache.token_cache.hits
+    assert client.post("/courses/", json={"title": "Biology", "description": "Intro to Biology"}, headers=headers).status_code == 201
+    assert cache.token_cache.hits == hits_before + 1
+
+
+def test_password_hashing_runs_in_worker_pool(client):
+    import passwords
+
+    completed_before = passwords.stats()["completed"]
+    client.post("/users/", json={"username": "testuser7", "password": "testpass"})
+    assert client.post("/token", data={"username": "testuser7", "password": "wrong"}).status_code == 401
+    token_response = client.post("/token", data={"username": "testuser7", "password": "testpass"})
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+
+    stats = client.get("/runtime/stats", headers=headers).json()["password_hashing"]
+    assert stats["completed"] == completed_before + 3
+    assert stats["waiting"] == 0 and stats["in_flight"] == 0
+
+
+def test_engine_factory_applies_pragmas_and_times_checkouts(tmp_path):
+    from sqlalchemy import text
+    from database import build_engine, pool_stats
+
+    engine = build_engine(f"sqlite:///{tmp_path / 'pragma.db'}", "pragma-test")
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+    assert engine.pool.size() == 5
+    assert pool_stats["pragma-test"]["checkouts"] == 1
+    engine.dispose()
+
+
+def test_batch_enrollment(client):
+    client.post("/users/", json={"username": "testuser8", "password": "testpass"})
+    token_response = client.post("/token", data={"username": "testuser8", "password": "testpass"})
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+    student_ids = [
+        client.post("/students/", json={"name": f"Batch {i}", "age": 20, "email": f"batch{i}@example.com"}, headers=headers).json()["id"]
+        for i in range(2)
+    ]
+    course_id = client.post("/courses/", json={"title": "Chemistry", "description": "Intro to Chemistry"}, headers=headers).json()["id"]
+    client.post("/enrollments", json={"student_id": student_ids[0], "course_id": course_id}, headers=headers)
+
+    batch = [
+        {"student_id": student_ids[0], "course_id": course_id},
+        {"student_id": student_ids[1], "course_id": course_id},
+        {"student_id": student_ids[1], "course_id": course_id},
+        {"student_id": 9999, "course_id": course_id},
+        {"student_id": student_ids[1], "course_id": 9999},
+    ]
+    response = client.post("/enrollments/batch", json=batch, headers=headers)
+    assert response.status_code == 200
+    assert [r["status"] for r in response.json()["results"]] == [
+        "already_enrolled", "enrolled", "duplicate_in_request", "student_not_found", "course_not_found",
+    ]
+    courses = client.get(f"/students/{student_ids[1]}/courses/", headers=headers).json()
+    assert courses == {"enrolled_courses": [course_id]}
+
+
+def test_student_full_text_search(client):
+    client.post("/users/", json={"username": "testuser9", "password": "testpass"})
+    token_response = client.post("/token", data={"username": "testuser9", "password": "testpass"})
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+    for i, (name, email) in enumerate([
+        ("Searchable Quinn", "quinn@school.edu"),
+        ("Quincy Adams", "qa@school.edu"),
+        ("Unrelated Person", "quill-pen@other.org"),
+    ]):
+        client.post("/students/", json={"name": name, "age": 20 + i, "email": email}, headers=headers)
+
+    response = client.get("/students/search", params={"q": "quin"}, headers=headers)
+    assert response.status_code == 200
+    assert {s["name"] for s in response.json()} == {"Searchable Quinn", "Quincy Adams"}
+
+    # Prefix match on email tokens, with quotes and operators treated as plain text
+    response = client.get("/students/search", params={"q": 'quill" OR *'}, headers=headers)
+    assert [s["name"] for s in response.json()] == ["Unrelated Person"]
+
+    # Keyset pagination over ranked results returns each match once
+    seen, cursor = [], None
+    while True:
+        params = {"q": "school", "limit": 1}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/students/search", params=params, headers=headers)
+        seen.extend(s["id"] for s in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert len(seen) == len(set(seen)) == 2
+
+
+def test_expanded_enrollment_lookups(client):
+    client.post("/users/", json={"username": "testuser10", "password": "testpass"})
+    token_response = client.post("/token", data={"username": "testuser10", "password": "testpass"})
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+    student_id = client.post("/students/", json={"name": "Expand", "age": 22, "email": "expand@example.com"}, headers=headers).json()["id"]
+    course_ids = [
+        client.post("/courses/", json={"title": title, "description": f"Intro to {title}"}, headers=headers).json()["id"]
+        for title in ("Biology", "History")
+    ]
+    client.post("/enrollments/batch", json=[{"student_id": student_id, "course_id": c} for c in course_ids], headers=headers)
+
+    response = client.get(f"/students/{student_id}/courses/", params={"expand": "courses"}, headers=headers)
+    assert response.status_code == 200
+    assert [c["title"] for c in response.json()["enrolled_courses"]] == ["Biology", "History"]
+
+    response = client.get(f"/courses/{course_ids[0]}/students", headers=headers)
+    assert response.status_code == 200
+    assert [s["email"] for s in response.json()["enrolled_students"]] == ["expand@example.com"]
+
+    empty_course = client.post("/courses/", json={"title": "Empty", "description": "No students"}, headers=headers).json()["id"]
+    assert client.get(f"/courses/{empty_course}/students", headers=headers).json() == {"enrolled_students": []}
+    assert client.get("/courses/9999/students", headers=headers).status_code == 404
+    assert client.get("/students/9999/courses/", params={"expand": "courses"}, headers=headers).status_code == 404
+
+
+def test_response_cache_etags_and_invalidation(client, monkeypatch):
+    client.post("/users/", json={"username": "testuser11", "password": "testpass"})
+    token_response = client.post("/token", data={"username": "testuser11", "password": "testpass"})
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+    student_id = client.post("/students/", json={"name": "Cached", "age": 23, "email": "cached@example.com"}, headers=headers).json()["id"]
+    course_id = client.post("/courses/", json={"title": "Art", "description": "Intro to Art"}, headers=headers).json()["id"]
+
+    first = client.get(f"/students/{student_id}", headers=headers)
+    assert first.status_code == 200 and first.json()["name"] == "Cached"
+    etag = first.headers["ETag"]
+    not_modified = client.get(f"/students/{student_id}", headers={**headers, "If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert client.get(f"/courses/{course_id}", headers=headers).json()["title"] == "Art"
+
+    # Enrolling invalidates both sides of the relationship
+    assert client.get(f"/students/{student_id}/courses/", headers=headers).json() == {"enrolled_courses": []}
+    assert client.get(f"/courses/{course_id}/students", headers=headers).json() == {"enrolled_students": []}
+    client.post("/enrollments", json={"student_id": student_id, "course_id": course_id}, headers=headers)
+    assert client.get(f"/students/{student_id}/courses/", headers=headers).json() == {"enrolled_courses": [course_id]}
+    assert len(client.get(f"/courses/{course_id}/students", headers=headers).json()["enrolled_students"]) == 1
+
+    # Cache fills never read from a replica, which could be behind the write that bumped the cache
+    async def lagging_replica():
+        raise AssertionError("cached endpoints must not read from a replica")
+        yield
+
+    monkeypatch.setitem(app.dependency_overrides, get_read_db, lagging_replica)
+    client.post("/students/", json={"name": "Fresh", "age": 24, "email": "fresh@example.com"}, headers=headers)
+    assert "fresh@example.com" in [s["email"] for s in client.get("/students/", params={"limit": 1000}, headers=headers).json()]
+    assert client.get(f"/students/{student_id}/courses/", params={"expand": "courses"}, headers=headers).status_code == 200
+
+    # Creating a student invalidates every cached list page
+    page = client.get("/students/", params={"limit": 1000}, headers=headers)
+    page_etag = page.headers["ETag"]
+    assert client.get("/students/", params={"limit": 1000}, headers={**headers, "If-None-Match": page_etag}).status_code == 304
+    client.post("/students/", json={"name": "Cached Two", "age": 23, "email": "cached2@example.com"}, headers=headers)
+    refreshed = client.get("/students/", params={"limit": 1000}, headers={**headers, "If-None-Match": page_etag})
+    assert refreshed.status_code == 200
+    assert len(refreshed.json()) == len(page.json()) + 1
+
+
+def test_structured_request_logging(client, caplog):
+    import logging
+    from logging_config import JsonFormatter
+
+    client.post("/users/", json={"username": "testuser12", "password": "testpass"})
+    token_response = client.post("/token", data={"username": "testuser12", "password": "testpass"})
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+    with caplog.at_level(logging.INFO, logger="main"):
+        client.get("/students/424242", headers=headers)
+    records = [r for r in caplog.records if r.name == "main" and r.getMessage() == "request"]
+    assert records[-1].fields["route"] == "/students/{student_id}"
+    assert records[-1].fields["status"] == 404
+    assert records[-1].fields["method"] == "GET"
+    formatted = json.loads(JsonFormatter().format(records[-1]))
+    assert formatted["route"] == "/students/{student_id}" and "duration_ms" in formatted
+
+    # Tracebacks survive the trip through the log queue as their own field
+    import queue
+    from logging_config import QueueHandler
+    log_queue = queue.SimpleQueue()
+    logger = logging.Logger("queued")
+    logger.addHandler(QueueHandler(log_queue))
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        logger.exception("division failed", extra={"fields": {"job_id": "j1"}})
+    formatted = json.loads(JsonFormatter().format(log_queue.get_nowait()))
+    assert formatted["message"] == "division failed" and formatted["job_id"] == "j1"
+    assert formatted["exc_info"].startswith("Traceback") and "ZeroDivisionError" in formatted["exc_info"]
+
+
+def test_metrics_endpoint(client):
+    client.post("/users/", json={"username": "testuser13", "password": "testpass"})
+    token_response = client.post("/token", data={"username": "testuser13", "password": "testpass"})
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+    client.get("/students/424243", headers=headers)
+    client.get("/no/such/path")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'http_requests_total{method="GET",route="/students/{student_id}",status="404"}' in body
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/students/{student_id}",le="+Inf"}' in body
+    assert 'route="<unmatched>"' in body
+    assert "http_requests_in_flight " in body
+    assert 'password_hash_duration_seconds_count{operation="verify"}' in body
+    # Engines are created lazily; the primary is reported once something has used it
+    import database
+    database.get_async_engine()
+    assert 'db_pool_checked_out{engine="async"}' in client.get("/metrics").text
+
+
+def test_query_metrics_survive_failed_statements(monkeypatch):
+    import metrics
+    import profiling
+    from sqlalchemy import create_engine, exc, text
+
+    engine = create_engine("sqlite://")
+    metrics.instrument_engine(engine, "failing")
+    profiling.instrument_engine(engine, "failing")
+    monkeypatch.setattr(profiling, "enabled", True)
+    profile = profiling.begin("GET", "/failing")
+    with engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(exc.OperationalError):
+                conn.execute(text("SELECT * FROM no_such_table"))
+        conn.execute(text("SELECT 1"))
+        # Nothing is left behind on the pooled connection by the statements that raised
+        assert "query_start" not in conn.info and "profile_start" not in conn.info
+    profiling.finish(profile, None)
+    assert 'db_queries_total{engine="failing"} 1' in metrics.render()
+    assert profile.queries == 1 and list(profile.statements) == ["SELECT 1"]
+
+
+def test_read_sessions_round_robin_over_replicas(monkeypatch):
+    import asyncio
+    import itertools
+    import database
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from sqlalchemy.orm import sessionmaker
+
+    assert database.sync_url_for("postgresql+asyncpg://u:p@db/app") == "postgresql+psycopg2://u:p@db/app"
+    assert database.sync_url_for("sqlite+aiosqlite:///./students.db") == "sqlite:///./students.db"
+
+    replicas = [create_async_engine("sqlite+aiosqlite:///:memory:") for _ in range(2)]
+    factories = [sessionmaker(bind=engine, class_=AsyncSession) for engine in replicas]
+    monkeypatch.setattr(database, "_replica_cycle", itertools.cycle(factories))
+
+    async def bound_engines():
+        engines = []
+        for _ in range(3):
+            generator = database.get_read_db()
+            session = await generator.__anext__()
+            engines.append(session.bind)
+            await generator.aclose()
+        return engines
+
+    assert asyncio.run(bound_engines()) == [replicas[0], replicas[1], replicas[0]]
+
+def test_creates_are_single_insert_returning(client, test_db):
+    from sqlalchemy import event
+
+    engine, _ = test_db
+    client.post("/users/", json={"username": "testuser14", "password": "testpass"})
+    assert client.post("/users/", json={"username": "testuser14", "password": "other"}).status_code == 400
+    token_response = client.post("/token", data={"username": "testuser14", "password": "testpass"})
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+    course_id = client.post("/courses/", json={"title": "Returning", "description": "d"}, headers=headers).json()["id"]
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        response = client.post("/students/", json={"name": "Ret", "age": 20, "email": "ret@example.com"}, headers=headers)
+        assert response.status_code == 201
+        assert response.json()["email"] == "ret@example.com"
+        student_id = response.json()["id"]
+        assert len(statements) == 1 and statements[0].startswith("INSERT INTO students") and "RETURNING" in statements[0]
+
+        statements.clear()
+        response = client.post("/enrollments", json={"student_id": student_id, "course_id": course_id}, headers=headers)
+        assert response.status_code == 200
+        assert statements[0].startswith("INSERT INTO enrollments")
+        assert len(statements) == 2 and statements[1].startswith("UPDATE course_enrollment_counts")
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", listener)
+
+    response = client.post("/students/", json={"name": "Ret", "age": 20, "email": "ret@example.com"}, headers=headers)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Email already registered"
+
+def test_aggregate_stats(client, test_db):
+    from sqlalchemy import func, select
+
+    client.post("/users/", json={"username": "testuser15", "password": "testpass"})
+    token_response = client.post("/token", data={"username": "testuser15", "password": "testpass"})
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+    courses = [client.post("/courses/", json={"title": f"Stats {i}", "description": "d"}, headers=headers).json()["id"] for i in range(3)]
+    students = [
+        client.post("/students/", json={"name": f"Stats {age}", "age": age, "email": f"stats{age}@example.com"}, headers=headers).json()["id"]
+        for age in (90, 91, 96)
+    ]
+    client.post("/enrollments", json={"student_id": students[0], "course_id": courses[1]}, headers=headers)
+    client.post("/enrollments/batch", json=[
+        {"student_id": students[1], "course_id": courses[1]},
+        {"student_id": students[2], "course_id": courses[1]},
+        {"student_id": students[2], "course_id": courses[2]},
+        {"student_id": students[2], "course_id": courses[2]},
+    ], headers=headers)
+
+    response = client.get(f"/stats/courses/{courses[1]}/enrollments", headers=headers)
+    assert response.json() == {"course_id": courses[1], "title": "Stats 1", "enrollment_count": 3}
+    assert client.get(f"/stats/courses/{courses[0]}/enrollments", headers=headers).json()["enrollment_count"] == 0
+    assert client.get("/stats/courses/424242/enrollments", headers=headers).status_code == 404
+
+    # The incrementally maintained totals agree with a GROUP BY over enrollments
+    engine, session_factory = test_db
+
+    async def live_counts():
+        async with session_factory() as db:
+            query = select(Enrollment.course_id, func.count()).group_by(Enrollment.course_id)
+            return dict((await db.execute(query)).all())
+
+    live = client.portal.call(live_counts)
+    summary = {row["course_id"]: row["enrollment_count"] for row in client.get("/stats/courses/enrollments", headers=headers).json()}
+    assert {course_id: count for course_id, count in summary.items() if count} == live
+
+    popular = client.get("/stats/courses/popular", params={"limit": 2}, headers=headers).json()
+    assert popular[0]["rank"] == 1 and popular[0]["enrollment_count"] >= popular[1]["enrollment_count"]
+
+    brackets = client.get("/stats/students/age-brackets", params={"width": 5}, headers=headers).json()
+    assert {"min_age": 90, "max_age": 94, "student_count": 2} in brackets
+    assert {"min_age": 95, "max_age": 99, "student_count": 1} in brackets
+    assert client.get("/stats/students/age-brackets", params={"width": 0}, headers=headers).status_code == 400
+
+def test_streaming_exports(client):
+    import csv
+    import gzip
+    import io
+    import export
+
+    client.post("/users/", json={"username": "testuser16", "password": "testpass"})
+    token_response = client.post("/token", data={"username": "testuser16", "password": "testpass"})
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+    course_id = client.post("/courses/", json={"title": "Export", "description": "d"}, headers=headers).json()["id"]
+    student_ids = [
+        client.post("/students/", json={"name": f"Export {i}", "age": 20, "email": f"export{i}@example.com"}, headers=headers).json()["id"]
+        for i in range(3)
+    ]
+    for student_id in student_ids[:2]:
+        client.post("/enrollments", json={"student_id": student_id, "course_id": course_id}, headers=headers)
+
+    response = client.get("/export/students", params={"course_id": course_id}, headers={**headers, "Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [int(row["id"]) for row in rows] == student_ids[:2]
+    assert rows[0]["email"] == "export0@example.com"
+
+    response = client.get("/export/enrollments", params={"course_id": course_id}, headers={**headers, "Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.text.splitlines()[0] == "id,student_id,course_id"
+    assert len(response.text.splitlines()) == 3
+    assert client.get("/export/enrollments", params={"course_id": 424242}, headers=headers).text.strip() == "id,student_id,course_id"
+
+    async def compressed(chunks):
+        async def source():
+            for chunk in chunks:
+                yield chunk
+        return b"".join([data async for data in export.gzip_chunks(source())])
+
+    assert gzip.decompress(client.portal.call(compressed, [b"a,b\n", b"1,2\n"])) == b"a,b\n1,2\n"
+    if export.pyarrow is None:
+        assert client.get("/export/students", params={"format": "parquet"}, headers=headers).status_code == 501
+
+def test_rate_limiting_and_admission_control(client, monkeypatch):
+    import ratelimit
+
+    client.post("/users/", json={"username": "testuser17", "password": "testpass"})
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(ratelimit, "buckets", ratelimit.MemoryBuckets())
+    monkeypatch.setattr(ratelimit, "LOGIN_RULE", ratelimit.Rule(per_minute=1, burst=2))
+    monkeypatch.setattr(ratelimit, "WRITE_RULE", ratelimit.Rule(per_minute=1, burst=1))
+
+    # The first request into a bucket always fits, whatever the clock reads
+    rule = ratelimit.Rule(per_minute=7, burst=1)
+    assert all(ratelimit._advance(None, rule, now)[0] is not None for now in range(10**14, 10**14 + 10**12, 10**9 + 7))
+
+    statuses = [client.post("/token", data={"username": "testuser17", "password": "testpass"}).status_code for _ in range(3)]
+    assert statuses == [200, 200, 429]
+    response = client.post("/token", data={"username": "testuser17", "password": "testpass"})
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) >= 1
+
+    # Writes are bucketed per user rather than per address
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", False)
+    token = client.post("/token", data={"username": "testuser17", "password": "testpass"}).json()["access_token"]
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", True)
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.post("/courses/", json={"title": "Limited", "description": "d"}, headers=headers).status_code == 201
+    assert client.post("/courses/", json={"title": "Limited", "description": "d"}, headers=headers).status_code == 429
+    assert client.get("/students/", headers=headers).status_code == 200
+
+    # Expensive routes are shed immediately once the concurrency cap is reached
+    monkeypatch.setattr(ratelimit, "gate", ratelimit.AdmissionGate(limit=1))
+    assert ratelimit.gate.try_enter()
+    response = client.get("/export/students", headers=headers)
+    assert response.status_code == 503 and response.headers["retry-after"] == "1"
+    ratelimit.gate.leave()
+    assert client.get("/export/students", headers=headers).status_code == 200
+    assert ratelimit.gate.stats() == {"limit": 1, "in_flight": 0, "admitted": 2, "shed": 1}
+    assert 'http_requests_shed_total{reason="overload"} 1' in client.get("/metrics").text
+
+def test_redis_rate_limit_buckets(monkeypatch):
+    import asyncio
+    import ratelimit
+
+    # redis and fakeredis are optional; the Redis backends import them on demand
+    redis_asyncio = pytest.importorskip("redis.asyncio")
+    fakeredis = pytest.importorskip("fakeredis")
+
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis_asyncio, "from_url", lambda url: fakeredis.FakeAsyncRedis(server=server))
+    rule = ratelimit.Rule(per_minute=60, burst=2)
+
+    async def take_four():
+        # Two workers sharing one server see one bucket
+        workers = [ratelimit.RedisBuckets("redis://unused"), ratelimit.RedisBuckets("redis://unused")]
+        return [await workers[i % 2].take("ip:1.2.3.4:login", rule) for i in range(4)]
+
+    waits = asyncio.run(take_four())
+    assert waits[:2] == [0.0, 0.0]
+    assert 0 < waits[2] <= 1.0 and 0 < waits[3] <= 1.0
+
+def test_readiness_checks_migration_head(client, test_db):
+    import database
+    from sqlalchemy import text
+
+    head = database.migration_head()
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.json() == {"status": "migrations_pending", "database": "ok", "revision": None, "head": head}
+
+    engine, _ = test_db
+
+    async def stamp(revision):
+        async with engine.begin() as conn:
+            await conn.execute(text("CREATE TABLE IF NOT EXISTS alembic_version (version_num VARCHAR(32) NOT NULL)"))
+            await conn.execute(text("DELETE FROM alembic_version"))
+            await conn.execute(text("INSERT INTO alembic_version VALUES (:revision)"), {"revision": revision})
+
+    client.portal.call(stamp, "b3dd1f3606df")
+    assert client.get("/ready").json()["status"] == "migrations_pending"
+    client.portal.call(stamp, head)
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.json() == {"status": "ready", "database": "ok", "revision": head, "head": head}
+
+def test_migrations_match_models(tmp_path):
+    import subprocess
+    import sys
+
+    # `alembic check` fails if autogenerate would emit anything, e.g. dropping the FTS tables
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    env = {**os.environ, "DATABASE_URL": f"sqlite+aiosqlite:///{tmp_path / 'migrated.db'}"}
+    for command in (["upgrade", "head"], ["check"]):
+        result = subprocess.run([sys.executable, "-m", "alembic", *command], cwd=app_dir, env=env, capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
+
+def test_multi_worker_launcher_shares_state_and_drains(tmp_path):
+    import signal
+    import socket
+    import subprocess
+    import sys
+    import time
+    import httpx
+
+    # Shared state comes from the launcher's fakeredis stand-in, and the workers need redis to reach it
+    pytest.importorskip("redis")
+    pytest.importorskip("fakeredis")
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    ready_file = tmp_path / "ready"
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.path.dirname(os.path.abspath(__file__)),
+        "DATABASE_URL": f"sqlite+aiosqlite:///{tmp_path / 'serve.db'}",
+        "RATE_LIMIT_WRITE_PER_MINUTE": "0.01",
+        "RATE_LIMIT_WRITE_BURST": "1",
+        "LOG_SAMPLE_RATE": "0",
+    }
+    launcher = subprocess.Popen(
+        [sys.executable, os.path.join(env["PYTHONPATH"], "serve.py"), "--workers", "2", "--port", str(port),
+         "--ready-file", str(ready_file), "--log-level", "warning"],
+        cwd=tmp_path, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + 60
+        while not ready_file.exists():
+            assert launcher.poll() is None and time.monotonic() < deadline
+            time.sleep(0.2)
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}") as http:
+            assert http.get("/health").status_code == 200
+            # One bucket shared through the launcher's Redis stand-in, whichever worker answers
+            statuses = [http.post("/students/", json={}, headers={"Connection": "close"}).status_code for _ in range(4)]
+        assert sorted(statuses) == [401, 429, 429, 429]
+    finally:
+        launcher.send_signal(signal.SIGTERM)
+        assert launcher.wait(timeout=60) == 0
+    assert not ready_file.exists()
+
+def _wait_for_job(client, headers, location):
+    for _ in range(200):
+        job = client.get(location, headers=headers).json()
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job did not finish: {job}")
+
+def test_background_jobs(client, monkeypatch, tmp_path):
+    # Workers write while requests read, so give them real connections to a file database
+    # rather than the single connection the in-memory test database is shared through
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'jobs.db'}")
+    JobSessions = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    client.portal.call(_reset_schema, engine)
+
+    async def _job_db():
+        async with JobSessions() as db:
+            yield db
+    monkeypatch.setitem(app.dependency_overrides, get_db, _job_db)
+    monkeypatch.setitem(app.dependency_overrides, get_read_db, _job_db)
+    monkeypatch.setitem(app.dependency_overrides, get_cache_fill_db, _job_db)
+    monkeypatch.setattr(jobs.queue, "session_factory", JobSessions)
+
+    client.post("/users/", json={"username": "jobuser", "password": "testpass"})
+    token = client.post("/token", data={"username": "jobuser", "password": "testpass"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    rows = [{"name": "Job One", "age": 20, "email": "job1@example.com"}, {"name": "Job Bad", "age": "x", "email": "job2@example.com"}]
+    response = client.post("/students/bulk", params={"background": "true"}, json=rows, headers=headers)
+    assert response.status_code == 202
+    assert response.json()["status"] == "queued"
+    job = _wait_for_job(client, headers, response.headers["location"])
+    assert job["status"] == "succeeded" and job["attempts"] == 1
+    assert [r["row"] for r in job["result"]["created"]] == [0]
+    assert [r["row"] for r in job["result"]["rejected"]] == [1]
+
+    # Jobs are only visible to the user who submitted them
+    client.post("/users/", json={"username": "jobother", "password": "testpass"})
+    other = client.post("/token", data={"username": "jobother", "password": "testpass"}).json()["access_token"]
+    assert client.get(response.headers["location"], headers={"Authorization": f"Bearer {other}"}).status_code == 404
+
+    # Failures are retried with backoff until they succeed or run out of attempts
+    calls = []
+
+    @jobs.handler("test.flaky")
+    async def flaky(db, payload):
+        calls.append(payload)
+        if len(calls) < payload["fail_times"] + 1:
+            raise RuntimeError("transient")
+        return {"calls": len(calls)}
+
+    monkeypatch.setattr(jobs.queue, "retry_backoff", 0.01)
+    job = client.portal.call(jobs.queue.submit, "test.flaky", {"fail_times": 1}, "jobuser")
+    job = _wait_for_job(client, headers, f"/jobs/{job.id}")
+    assert (job["status"], job["attempts"], job["result"]) == ("succeeded", 2, {"calls": 2})
+    calls.clear()
+    job = client.portal.call(jobs.queue.submit, "test.flaky", {"fail_times": 5}, "jobuser")
+    job = _wait_for_job(client, headers, f"/jobs/{job.id}")
+    assert (job["status"], job["attempts"], job["error"]) == ("failed", 3, "RuntimeError: transient")
+
+    # A failed save is retried without running the handler again, and does not kill the worker
+    save, failed_saves = jobs.queue.store.save, []
+
+    async def save_failing_once(db, job):
+        if not failed_saves:
+            failed_saves.append((job.id, jobs.queue.store._jobs[job.id].status))
+            raise RuntimeError("database is locked")
+        await save(db, job)
+
+    monkeypatch.setattr(jobs.queue.store, "save", save_failing_once)
+    calls.clear()
+    job = client.portal.call(jobs.queue.submit, "test.flaky", {"fail_times": 0}, "jobuser")
+    job = _wait_for_job(client, headers, f"/jobs/{job.id}")
+    # Until the outcome was saved, readers still saw the job running
+    assert failed_saves == [(job["id"], "running")]
+    assert (job["status"], job["attempts"], job["result"]) == ("succeeded", 1, {"calls": 1})
+    job = client.portal.call(jobs.queue.submit, "test.flaky", {"fail_times": 0}, "jobuser")
+    assert _wait_for_job(client, headers, f"/jobs/{job.id}")["status"] == "succeeded"
+    assert not any(task.done() for task in jobs.queue._tasks)
+
+    # The durable store keeps jobs in the jobs table
+    monkeypatch.setattr(jobs.queue, "store", jobs.DatabaseJobStore())
+    course_id = client.post("/courses/", json={"title": "Jobs 101", "description": "d"}, headers=headers).json()["id"]
+    student_id = client.get("/students/", params={"limit": 1}, headers=headers).json()[0]["id"]
+    pairs = [{"student_id": student_id, "course_id": course_id}, {"student_id": 999999, "course_id": course_id}]
+    response = client.post("/enrollments/batch", params={"background": "true"}, json=pairs, headers=headers)
+    assert response.status_code == 202
+    job = _wait_for_job(client, headers, response.headers["location"])
+    assert [r["status"] for r in job["result"]["results"]] == ["enrolled", "student_not_found"]
+
+    response = client.post("/stats/courses/recompute", headers=headers)
+    assert response.status_code == 202
+    job = _wait_for_job(client, headers, response.headers["location"])
+    assert job["status"] == "succeeded" and job["result"]["courses"] >= 1
+    assert client.get(f"/stats/courses/{course_id}/enrollments", headers=headers).json()["enrollment_count"] == 1
+    assert client.get("/runtime/stats", headers=headers).json()["jobs"]["succeeded"] >= 4
+    body = client.get("/metrics").text
+    assert 'background_jobs_total{kind="test.flaky",outcome="retried"}' in body
+    assert 'background_jobs_total{kind="stats.recompute_course_counts",outcome="succeeded"} 1' in body
+    assert 'background_job_duration_seconds_count{kind="students.bulk_import"}' in body
+    client.portal.call(engine.dispose)
+
+def test_self_contained_tokens_refresh_and_revocation(client, test_db):
+    from jose import jwt
+    import crud
+
+    client.post("/users/", json={"username": "tokenuser", "password": "testpass"})
+    issued = client.post("/token", data={"username": "tokenuser", "password": "testpass"}).json()
+    assert issued["token_type"] == "bearer" and issued["expires_in"] == settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    claims = jwt.get_unverified_claims(issued["access_token"])
+    assert claims["sub"] == "tokenuser" and claims["act"] is True and claims["ver"] == 0 and claims["jti"]
+    headers = {"Authorization": f"Bearer {issued['access_token']}"}
+    assert client.get("/students/", headers=headers).status_code == 200
+    # A refresh token is not an access token
+    assert client.get("/students/", headers={"Authorization": f"Bearer {issued['refresh_token']}"}).status_code == 401
+
+    # Refreshing rotates the refresh token; reusing the old one revokes every token of the user
+    refreshed = client.post("/token/refresh", json={"refresh_token": issued["refresh_token"]}).json()
+    new_headers = {"Authorization": f"Bearer {refreshed['access_token']}"}
+    assert client.get("/students/", headers=new_headers).status_code == 200
+    assert client.post("/token/refresh", json={"refresh_token": issued["refresh_token"]}).status_code == 401
+    assert client.get("/students/", headers=new_headers).status_code == 401
+    assert client.post("/token/refresh", json={"refresh_token": refreshed["refresh_token"]}).status_code == 401
+
+    # Logging out revokes the access token and the refresh token passed with it
+    issued = client.post("/token", data={"username": "tokenuser", "password": "testpass"}).json()
+    headers = {"Authorization": f"Bearer {issued['access_token']}"}
+    assert client.get("/students/", headers=headers).status_code == 200
+    assert client.post("/token/revoke", json={"refresh_token": issued["refresh_token"]}, headers=headers).status_code == 204
+    assert client.get("/students/", headers=headers).status_code == 401
+    assert client.post("/token/refresh", json={"refresh_token": issued["refresh_token"]}).status_code == 401
+
+    # Revocations written by another process are picked up by the background reload
+    issued = client.post("/token", data={"username": "tokenuser", "password": "testpass"}).json()
+    headers = {"Authorization": f"Bearer {issued['access_token']}"}
+    assert client.get("/students/", headers=headers).status_code == 200
+    claims = jwt.get_unverified_claims(issued["access_token"])
+    _, TestingSessionLocal = test_db
+
+    async def revoke_elsewhere():
+        async with TestingSessionLocal() as db:
+            await crud.revoke_token(db, claims["jti"], claims["exp"])
+            await tokens.revocations.reload(db)
+
+    client.portal.call(revoke_elsewhere)
+    assert client.get("/students/", headers=headers).status_code == 401
+
+    # Tokens from before uid/ver claims still authenticate through the users table
+    legacy = jwt.encode({"sub": "tokenuser", "exp": int(time.time()) + 60}, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    assert client.get("/students/", headers={"Authorization": f"Bearer {legacy}"}).status_code == 401  # version was bumped above
+    client.post("/users/", json={"username": "legacyuser", "password": "testpass"})
+    legacy = jwt.encode({"sub": "legacyuser", "exp": int(time.time()) + 60}, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    assert client.get("/students/", headers={"Authorization": f"Bearer {legacy}"}).status_code == 200
+
+def test_query_profiling(client, test_db, monkeypatch):
+    import profiling
+
+    client.post("/users/", json={"username": "profileuser", "password": "testpass"})
+    token = client.post("/token", data={"username": "profileuser", "password": "testpass"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("/students/", headers=headers)
+    assert "server-timing" not in response.headers
+    assert client.get("/debug/queries", headers=headers).status_code == 404
+
+    engine, _ = test_db
+    profiling.instrument_engine(engine, "test")
+    profiling.reset()
+    monkeypatch.setattr(profiling, "enabled", True)
+    monkeypatch.setattr(profiling, "slow_ms", 0)
+    monkeypatch.setattr(profiling, "n_plus_one_threshold", 3)
+
+    # chunk_size=1 repeats the duplicate-email check once per row
+    rows = [{"name": f"Profiled {i}", "age": 20, "email": f"profiled{i}@example.com"} for i in range(3)]
+    response = client.post("/students/bulk", params={"chunk_size": 1}, json=rows, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["server-timing"].startswith("db;dur=")
+    assert 'desc="6 queries"' in response.headers["server-timing"]
+
+    report = client.get("/debug/queries", headers=headers).json()
+    bulk = next(r for r in report["recent_requests"] if r["route"] == "/students/bulk")
+    assert bulk["queries"] == 6
+    assert [n["statement"] for n in bulk["n_plus_one"]] == [
+        "SELECT students.email FROM students WHERE students.email IN (...)",
+        "INSERT INTO students (name, age, email) VALUES (?, ?, ?) RETURNING id",
+    ]
+    select_plan = next(s["plan"] for s in bulk["slow"] if s["statement"].startswith("SELECT students.email"))
+    assert any("ix_students_email" in line for line in select_plan)
+    assert report["statements"][0]["count"] >= 1
+
+def test_compression_and_conditional_list_requests(client, monkeypatch):
+    import math
+    from email.utils import formatdate, parsedate_to_datetime
+    import cache
+    import crud
+
+    client.post("/users/", json={"username": "etaguser", "password": "testpass"})
+    token = client.post("/token", data={"username": "etaguser", "password": "testpass"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    rows = [{"name": f"Compressed {i}", "age": 20, "email": f"compressed{i}@example.com"} for i in range(40)]
+    assert client.post("/students/bulk", json=rows, headers=headers).status_code == 200
+
+    response = client.get("/students/", params={"limit": 500}, headers={**headers, "Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    listed = len(response.json())
+    assert listed >= 40
+    etag = response.headers["etag"]
+    assert etag.startswith('W/"students-')
+    identity = client.get("/students/", headers={**headers, "Accept-Encoding": "identity"})
+    assert "content-encoding" not in identity.headers
+    assert identity.headers["etag"] == etag
+    assert "content-encoding" not in client.get("/health", headers={"Accept-Encoding": "gzip"}).headers
+
+    # A matching revalidation is answered from the change counter alone
+    async def no_query(*args, **kwargs):
+        raise AssertionError("a 304 must not query the database")
+
+    with monkeypatch.context() as patched:
+        patched.setattr(crud, "get_students_after", no_query)
+        response = client.get("/students/", params={"limit": 7}, headers={**headers, "If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag
+        changed_at = client.portal.call(cache.response_cache.validators, "students").last_modified
+        after_change = formatdate(math.floor(changed_at) + 1, usegmt=True)
+        assert client.get("/students/", params={"limit": 7}, headers={**headers, "If-Modified-Since": after_change}).status_code == 304
+
+    # A date in the same second as the change cannot prove the copy is current
+    same_second = formatdate(math.floor(changed_at), usegmt=True)
+    response = client.get("/students/", params={"limit": 7}, headers={**headers, "If-Modified-Since": same_second})
+    assert response.status_code == 200
+    if "last-modified" in response.headers:
+        assert parsedate_to_datetime(response.headers["last-modified"]).timestamp() > changed_at
+
+    assert client.post("/students/", json={"name": "Changed", "age": 21, "email": "changed@example.com"}, headers=headers).status_code == 201
+    response = client.get("/students/", params={"limit": 500}, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert len(response.json()) == listed + 1
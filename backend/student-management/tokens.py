@@ -0,0 +1,127 @@
+# tokens.py
+import asyncio
+import logging
+import secrets
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from jose import JWTError, jwt
+
+import crud
+import schemas
+from config import settings, SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, REFRESH_TOKEN_EXPIRE_DAYS
+from database import primary_sessions
+
+logger = logging.getLogger("tokens")
+
+# Access tokens carry everything get_current_user needs, in short claim names:
+#   sub username, uid user id, act is_active, ver users.token_version at issue, jti token id, exp expiry.
+# Refresh tokens carry sub/uid/ver/jti/exp plus typ="refresh" and are only accepted by /token/refresh.
+REFRESH = "refresh"
+
+class InvalidTokenError(Exception):
+    pass
+
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated user of a request and the access token they presented."""
+    user: schemas.User
+    jti: Optional[str] = None
+    expires_at: Optional[float] = None
+    version: int = 0
+
+    @property
+    def username(self) -> str:
+        return self.user.username
+
+def _encode(claims: dict) -> str:
+    return jwt.encode(claims, SECRET_KEY, algorithm=ALGORITHM)
+
+def issue_access_token(user) -> tuple:
+    """(token, expires_in seconds) for a users row or schemas.User with token_version."""
+    expires_in = ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    claims = {
+        "sub": user.username, "uid": user.id, "act": user.is_active, "ver": user.token_version,
+        "jti": secrets.token_urlsafe(12), "exp": int(time.time()) + expires_in,
+    }
+    return _encode(claims), expires_in
+
+def issue_refresh_token(user) -> str:
+    claims = {
+        "sub": user.username, "uid": user.id, "ver": user.token_version, "typ": REFRESH,
+        "jti": secrets.token_urlsafe(12), "exp": int(time.time()) + REFRESH_TOKEN_EXPIRE_DAYS * 86400,
+    }
+    return _encode(claims)
+
+def decode(token: str, typ: Optional[str] = None) -> dict:
+    """Verify signature and expiry locally; raises InvalidTokenError."""
+    try:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError as e:
+        raise InvalidTokenError(str(e))
+    if claims.get("sub") is None or claims.get("typ") != typ:
+        raise InvalidTokenError("Wrong token type")
+    return claims
+
+class RevocationList:
+    """Revoked token ids and per-user minimum token versions, mirrored from the database.
+
+    Revocations made by this process apply at once; those made by other workers are picked
+    up by the background reload every TOKEN_REVOCATION_REFRESH_SECONDS.
+    """
+
+    def __init__(self, refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self._jtis = {}  # jti -> expiry
+        self._versions = {}  # user id -> lowest token_version still accepted
+        self.session_factory = None  # defaults to the primary database
+        self._task = None
+        self._loop = None
+        self.reloads = 0
+        self.loaded_at = None
+
+    def is_revoked(self, jti: Optional[str], user_id: int, version: int) -> bool:
+        return jti in self._jtis or version < self._versions.get(user_id, 0)
+
+    def revoke_jti(self, jti: str, expires_at: float):
+        self._jtis[jti] = expires_at
+
+    def revoke_versions_below(self, user_id: int, version: int):
+        self._versions[user_id] = max(version, self._versions.get(user_id, 0))
+
+    async def reload(self, db):
+        # Revocations are never undone, so merge rather than replace: one made here while the
+        # query ran is not lost, and only entries whose token has expired anyway are dropped.
+        now = time.time()
+        jtis, versions = await crud.get_revocations(db, now)
+        self._jtis = {jti: exp for jti, exp in {**self._jtis, **jtis}.items() if exp >= now}
+        for user_id, version in versions.items():
+            self.revoke_versions_below(user_id, version)
+        self.reloads += 1
+        self.loaded_at = time.time()
+
+    async def _run(self):
+        while True:
+            try:
+                async with (self.session_factory or primary_sessions())() as db:
+                    await self.reload(db)
+            except Exception:
+                logger.exception("could not reload the token revocation list")
+            await asyncio.sleep(self.refresh_seconds)
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if self._task is not None and self._loop is loop:
+            return
+        self._loop, self._task = loop, loop.create_task(self._run(), name="token-revocations")
+
+    def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"revoked_jtis": len(self._jtis), "revoked_users": len(self._versions), "reloads": self.reloads, "loaded_at": self.loaded_at}
+
+revocations = RevocationList(settings.TOKEN_REVOCATION_REFRESH_SECONDS)